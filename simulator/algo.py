@@ -7,13 +7,60 @@ import matplotlib.pyplot as plt
 
 import utils
 import para
+import kernels
 
 # Collection of sync algorithms
 # sync_func(cur_error, cur_bound, cur_topo)
 #   -> cur_error, cur_bound, sync_count:
+# The array versions also take errors and bounds of shape (replicas, nb_node),
+# and sync all replicas over the same topology.
 
 def syncwise(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int,
              path_length_tracker, path_length_counter) -> tuple[list, list, int]:
+    """
+    Every node syncs with the neighbor of the smallest bound if that tightens its own bound.
+    Array version of syncwise_reference(), giving the same result for the same rng state.
+    """
+    nb_node = cur_bound.shape[-1]
+    prev_error = cur_error.reshape(-1, nb_node)
+    prev_bound = cur_bound.reshape(-1, nb_node)
+    now_error = prev_error.copy()
+    now_bound = prev_bound.copy()
+
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    rows, arg, min_neighbor_bound = utils.segment_argmin(prev_bound[:, indices], indptr)
+    chosen_neighbor = indices[arg]
+
+    # Synced entries, replica by replica and in node order within a replica
+    replica, row = np.nonzero(prev_bound[:, nodes[rows]] > min_neighbor_bound + hop_error_bound)
+    node = nodes[rows][row]
+    chosen_neighbor = chosen_neighbor[replica, row]
+    sync_count = len(node)
+
+    now_bound[replica, node] = min_neighbor_bound[replica, row] + hop_error_bound
+    now_error[replica, node] = prev_error[replica, chosen_neighbor] + para.get_hop_errors(rng, sync_count, hop_error_bound)
+
+    # Nodes sync in order, so a neighbor synced earlier in this round passes on its new path length
+    node = replica * nb_node + node
+    chosen_neighbor = replica * nb_node + chosen_neighbor
+    hop_count = path_length_tracker.ravel()[chosen_neighbor] + 1
+    order = np.full(path_length_tracker.size, sync_count)
+    order[node] = np.arange(sync_count)
+    depend = np.flatnonzero(order[chosen_neighbor] < np.arange(sync_count))
+    parent = order[chosen_neighbor[depend]]
+    while len(depend):
+        updated = hop_count[parent] + 1
+        if np.array_equal(updated, hop_count[depend]):
+            break
+        hop_count[depend] = updated
+    np.put(path_length_tracker, node, hop_count)
+    path_length_counter.add(hop_count, node, chosen_neighbor)
+
+    return now_error.reshape(cur_error.shape), now_bound.reshape(cur_bound.shape), sync_count
+
+def syncwise_reference(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int,
+             path_length_tracker, path_length_counter) -> tuple[list, list, int]:
+    """Node-by-node SyncWise, kept as the reference for syncwise()"""
     sync_count = 0
     #print(np.round(cur_bound,4))
     prev_error = cur_error
@@ -21,7 +68,7 @@ def syncwise(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.
     now_error = copy.deepcopy(cur_error)
     now_bound = copy.deepcopy(cur_bound)
 
-    assert isinstance(cur_topo, nx.Graph)
+    cur_topo = utils.get_graph(cur_topo)
     #print("In this time slice:")
 
     sync_record = []
@@ -44,9 +91,7 @@ def syncwise(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.
             #print(f"Sync with {chosen_neighbor}, bound from {prev_bound[node]} to {now_bound[node]}")
             #print(f"Sync with {chosen_neighbor}, clk error from {prev_error[node]} to {now_error[node]}")
             path_length_tracker[node] = path_length_tracker[chosen_neighbor] + 1
-            hop_count = path_length_tracker[node]
-            if hop_count != 0: # skip inital phase
-                path_length_counter[hop_count] += 1
+            path_length_counter.add(path_length_tracker[node], node, chosen_neighbor)
         else:
             sync_record.append(9)
     #print(f"sync record={sync_record}")
@@ -57,6 +102,27 @@ def syncwise(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.
     return now_error, now_bound, sync_count
 
 def dtp(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int) -> tuple[list, list, int]:
+    """Every node follows the fastest neighbor. Array version of dtp_reference()"""
+    sync_count = 0
+    prev_error = cur_error
+    now_error = copy.deepcopy(cur_error)
+    now_bound = copy.deepcopy(cur_bound)
+
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    has_neighbor = np.diff(indptr) > 0
+    for node in nodes[~has_neighbor]:
+        print(f"{node=} has no neighbors")
+    rows = np.flatnonzero(has_neighbor)
+    if len(rows):
+        max_neighbor_error = np.maximum.reduceat(prev_error[..., indices], indptr[rows], axis=-1)
+        now_error[..., nodes[rows]] = max_neighbor_error + para.get_hop_errors(rng, max_neighbor_error.shape, hop_error_bound)
+
+    # DTP does internal sync
+    now_error = now_error - np.average(now_error, axis=-1, keepdims=True)
+
+    return now_error, now_bound, sync_count
+
+def dtp_reference(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int) -> tuple[list, list, int]:
     sync_count = 0
     #print(f"{cur_bound=}")
     prev_error = cur_error
@@ -64,7 +130,7 @@ def dtp(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph
     now_error = copy.deepcopy(cur_error)
     now_bound = copy.deepcopy(cur_bound)
 
-    assert isinstance(cur_topo, nx.Graph)
+    cur_topo = utils.get_graph(cur_topo)
 
     for node in cur_topo.nodes():
         neighbors = utils.get_neighbors(cur_topo, node)
@@ -82,6 +148,20 @@ def dtp(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph
     return now_error, now_bound, sync_count
 
 def graham(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int) -> tuple[list, list, int]:
+    """Only sync with master. Array version of graham_reference()"""
+    now_error = copy.deepcopy(cur_error)
+    now_bound = copy.deepcopy(cur_bound)
+
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    row_of_neighbor = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+    node = nodes[np.unique(row_of_neighbor[indices == 0])]
+    now_bound[..., node] = hop_error_bound
+    now_error[..., node] = para.get_hop_errors(rng, cur_error.shape[:-1] + (len(node),), hop_error_bound)
+    sync_count = now_error[..., node].size
+
+    return now_error, now_bound, sync_count
+
+def graham_reference(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int) -> tuple[list, list, int]:
     """Only sync with master"""
     sync_count = 0
     #print(f"{cur_bound=}")
@@ -90,6 +170,7 @@ def graham(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Gr
     now_error = copy.deepcopy(cur_error)
     now_bound = copy.deepcopy(cur_bound)
 
+    cur_topo = utils.get_graph(cur_topo)
     for node in cur_topo.nodes():
         neighbors = utils.get_neighbors(cur_topo, node)
         if 0 in neighbors:
@@ -100,6 +181,28 @@ def graham(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Gr
     return now_error, now_bound, sync_count
 def spanning_tree(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int,
                   path_length_tracker, path_length_counter) -> tuple[list, list, int]:
+    """Sync along the BFS tree rooted at node 0. Array version of spanning_tree_reference()"""
+    prev_error = cur_error
+    prev_bound = cur_bound
+    now_error = copy.deepcopy(cur_error)
+    now_bound = copy.deepcopy(cur_bound)
+
+    src, dst, depth = utils.bfs_edges(utils.get_csr(cur_topo), source=0)
+    now_bound[..., dst] = prev_bound[..., src] + hop_error_bound
+    now_error[..., dst] = prev_error[..., src] + para.get_hop_errors(rng, cur_error.shape[:-1] + (len(dst),), hop_error_bound)
+    sync_count = now_error[..., dst].size
+
+    # Parents sync before their children, so the path length is the depth in the tree
+    hop_count = path_length_tracker[..., :1] + depth
+    path_length_tracker[..., dst] = hop_count
+    # Flat indices replica * nb_node + node, replica by replica
+    offset = np.arange(0, path_length_tracker.size, path_length_tracker.shape[-1])[:, None]
+    path_length_counter.add(hop_count, offset + dst, offset + src)
+
+    return now_error, now_bound, sync_count
+
+def spanning_tree_reference(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int,
+                  path_length_tracker, path_length_counter) -> tuple[list, list, int]:
     sync_count = 0
     #print(f"{cur_bound=}")
     prev_error = cur_error
@@ -107,6 +210,7 @@ def spanning_tree(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo
     now_error = copy.deepcopy(cur_error)
     now_bound = copy.deepcopy(cur_bound)
 
+    cur_topo = utils.get_graph(cur_topo)
     bfs_tree = nx.bfs_tree(cur_topo, source=0)
     #pos = nx.spring_layout(bfs_tree)
     #nx.draw(bfs_tree, pos, with_labels=True)
@@ -120,15 +224,48 @@ def spanning_tree(rng, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo
         #print(f"{src} with error {prev_error[src]} sync {dst} with error {prev_error[dst]}, new error {now_error[dst]}")
         sync_count += 1
         path_length_tracker[dst] = path_length_tracker[src] + 1
-        hop_count = path_length_tracker[dst]
-        if hop_count != 0:
-            path_length_counter[hop_count] += 1
+        path_length_counter.add(path_length_tracker[dst], dst, src)
     
     #print(now_error[:10])
     #print(f"{hop_error_bound=}")
     return now_error, now_bound, sync_count
 
 def firefly(rng : np.random.Generator, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int) -> tuple[list, list, int]:
+    """
+    firefly algo, where sync with randomly picked nodes. Array version of firefly_reference():
+    the noise of all hops is drawn in one batch and summed per node, so results follow the
+    same distribution but not the same random stream.
+    """
+    sync_count = 0
+    prev_error = cur_error
+    now_bound = cur_bound # firefly has no bound
+
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    hop_distances = utils.get_hop_distances(cur_topo) # computed once per slice
+    nb_link = int(np.diff(indptr)[nodes == 0][0])
+    nb_other = len(nodes) - 1
+
+    # Every node picks nb_link other nodes uniformly, with replacement
+    rows = np.arange(len(nodes))[:, None]
+    picked = rng.integers(0, nb_other, size=cur_error.shape[:-1] + (len(nodes), nb_link))
+    neighbors = nodes[picked + (picked >= rows)]
+
+    # Noise of every hop on the paths to the picked nodes, not connected ones have none
+    hop_length = np.maximum(hop_distances[nodes[:, None], neighbors], 0)
+    nb_hop = hop_length.sum(axis=-1).ravel()
+    hop_noise = para.get_hop_errors(rng, nb_hop.sum(), hop_error_bound) + para.get_path_asymmetries(rng, nb_hop.sum())
+    noise = np.bincount(np.repeat(np.arange(len(nb_hop)), nb_hop), weights=hop_noise, minlength=len(nb_hop))
+
+    now_error = np.array(cur_error, dtype=float)
+    neighbor_errors = np.take_along_axis(prev_error, neighbors.reshape(neighbors.shape[:-2] + (-1,)), axis=-1)
+    now_error[..., nodes] = (neighbor_errors.reshape(neighbors.shape).sum(axis=-1) + noise.reshape(hop_length.shape[:-1])) / nb_link
+
+    # Cailibrate error viewing for the ease of debugging
+    now_error = now_error - np.average(now_error, axis=-1, keepdims=True)
+
+    return now_error, now_bound, sync_count
+
+def firefly_reference(rng : np.random.Generator, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int) -> tuple[list, list, int]:
     """firefly algo, where sync with randomly picked nodes"""
     sync_count = 0
     
@@ -137,9 +274,10 @@ def firefly(rng : np.random.Generator, cur_error : np.ndarray, cur_bound : np.nd
     #now_bound = copy.deepcopy(cur_bound)
     now_bound = cur_bound # firefly has no bound
 
-    assert isinstance(cur_topo, nx.Graph)
+    assert cur_error.ndim == 1, "firefly does not run replicas"
+    hop_distances = utils.get_hop_distances(cur_topo) # computed once per slice
+    cur_topo = utils.get_graph(cur_topo)
 
-    all_shortest_paths = dict(nx.all_pairs_shortest_path_length(cur_topo))
     sum_hop_len = 0
 
     nb_link = len(utils.get_neighbors(cur_topo, 0))
@@ -153,10 +291,10 @@ def firefly(rng : np.random.Generator, cur_error : np.ndarray, cur_bound : np.nd
         
         noise = 0
         for neighbor in neighbors:
-            if neighbor not in all_shortest_paths[node].keys():
+            hop_length = int(hop_distances[node, neighbor])
+            if hop_length < 0:
                 # Not connected
                 continue
-            hop_length = all_shortest_paths[node][neighbor]
             sum_hop_len += hop_length
             #hop_length = max(hop_length, 50)
             #print(f"{hop_length=}")
@@ -177,6 +315,27 @@ def firefly(rng : np.random.Generator, cur_error : np.ndarray, cur_bound : np.nd
     return now_error, now_bound, sync_count
 
 def firefly_optimized(rng : np.random.Generator, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int) -> tuple[list, list, int]:
+    """Applied firefly into rdcn, where only sync with direct neighbors. Array version of firefly_optimized_reference()"""
+    sync_count = 0
+    prev_error = cur_error
+    now_error = copy.deepcopy(cur_error)
+    now_bound = cur_bound
+
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    degrees = np.diff(indptr)
+    # One hop error per node, counted once per neighbor
+    noise = para.get_hop_errors(rng, cur_error.shape[:-1] + (len(nodes),), hop_error_bound)
+    noise_sum = np.zeros(noise.shape)
+    for k in range(degrees.max(initial=0)):
+        noise_sum[..., degrees > k] += noise[..., degrees > k]
+    now_error[..., nodes] = (utils.segment_sum(prev_error[..., indices], indptr) + noise_sum) / degrees
+
+    # Cailibrate error viewing for the ease of debugging
+    now_error = now_error - np.average(now_error, axis=-1, keepdims=True)
+
+    return now_error, now_bound, sync_count
+
+def firefly_optimized_reference(rng : np.random.Generator, cur_error : np.ndarray, cur_bound : np.ndarray, cur_topo : nx.Graph, hop_error_bound : int) -> tuple[list, list, int]:
     """Applied firefly into rdcn, where only sync with direct neighbors"""
     sync_count = 0
     
@@ -186,7 +345,7 @@ def firefly_optimized(rng : np.random.Generator, cur_error : np.ndarray, cur_bou
     #now_bound = copy.deepcopy(cur_bound)
     now_bound = cur_bound
 
-    assert isinstance(cur_topo, nx.Graph)
+    cur_topo = utils.get_graph(cur_topo)
 
     for node in cur_topo.nodes():
         neighbors = utils.get_neighbors(cur_topo, node)
@@ -199,4 +358,39 @@ def firefly_optimized(rng : np.random.Generator, cur_error : np.ndarray, cur_bou
     now_error = now_error - np.average(now_error)
     #print(f"{now_error=}")
 
-    return now_error, now_bound, sync_count
\ No newline at end of file
+    return now_error, now_bound, sync_count
+
+# Implementations of the sync algorithms per backend:
+#   numpy: the array versions above (default)
+#   python: the node-by-node *_reference loops, for equivalence tests
+#   numba: the compiled kernels in kernels.py
+# Algorithms without an implementation in a backend run as they are.
+# For the same rng state (a np.random.Generator or a para.NoiseProvider, with any
+# noise models), syncwise, dtp, graham, spanning_tree and firefly_optimized give
+# bit-identical results in every backend. firefly has no numba kernel, and its
+# python version draws hop errors and path asymmetries interleaved hop by hop
+# instead of in two batches: same distribution, different trajectories.
+backends = {
+    "numpy": {},
+    "python": {
+        syncwise: syncwise_reference,
+        dtp: dtp_reference,
+        graham: graham_reference,
+        spanning_tree: spanning_tree_reference,
+        firefly_optimized: firefly_optimized_reference,
+        firefly: firefly_reference,
+    },
+    "numba": {
+        syncwise: kernels.syncwise,
+        dtp: kernels.dtp,
+        graham: kernels.graham,
+        spanning_tree: kernels.spanning_tree,
+        firefly_optimized: kernels.firefly_optimized,
+    },
+}
+
+def get_backend(sync_algo, backend = "numpy"):
+    """The implementation of sync_algo in the given backend"""
+    if backend not in backends:
+        raise ValueError(f"Unknown backend {backend}, choose from {list(backends)}")
+    return backends[backend].get(sync_algo, sync_algo)
@@ -0,0 +1,247 @@
+# Throughput benchmarks of the simulator
+#
+# Times topology generation, Simulator construction and sync iterations of every
+# algorithm over a grid of sizes, with the peak memory allocated while building and
+# running, and writes the results as JSON to compare versions:
+#   python bench.py --out before.json
+#   python bench.py --out after.json --compare before.json
+# The default grid stops at 4096 nodes, --large adds 16384 (firefly alone then
+# takes about 20 s per iteration).
+
+import os
+import io
+import sys
+import json
+import time
+import inspect
+import platform
+import argparse
+import contextlib
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import topo
+from sweep import factories, expand_grid
+
+algorithms = ["syncwise", "graham", "dtp", "firefly", "ptp"]
+
+default_grid = {
+    "algorithm": algorithms,
+    "nb_node": [64, 256, 1024, 4096],
+    "nb_link": [1, 2, 4, 8],
+    "backend": ["numpy"],
+}
+
+# Sizes added to the default grid by --large
+large_nb_node = [16384]
+
+# Parameters of every run, only the time they take matters here. Runs keep
+# running statistics instead of every iteration, as the runs of a sweep do.
+sim_params = {
+    "sync_interval_ns": 100 * 1000,
+    "slice_duration_ns": 100 * 1000,
+    "dv_bound": 50,
+    "hop_error_bound": 5,
+    "record_stats_only": True,
+}
+
+def get_topo_func(algorithm, nb_node, lazy_from):
+    """
+    Topology of an algorithm: the default of its factory, except that opera is
+    replaced by topo.opera_lazy from lazy_from nodes on. opera holds O(nb_node^2)
+    circuits (about 0.5 GB at 4096 nodes).
+    """
+    topo_func = inspect.signature(factories[algorithm]).parameters["topo_func"].default
+    if topo_func is topo.opera and lazy_from is not None and nb_node >= lazy_from:
+        return topo.opera_lazy
+    return topo_func
+
+def version_info() -> dict:
+    """What the results were measured with"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba_version,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def run_timed(sim, min_time_s) -> tuple[int, float]:
+    """Run sim for doubling numbers of iterations until min_time_s passed, return (iterations, seconds)"""
+    nb_iter, elapsed, chunk = 0, 0.0, 1
+    while elapsed < min_time_s:
+        start = time.perf_counter()
+        sim.run(chunk)
+        elapsed += time.perf_counter() - start
+        nb_iter += chunk
+        chunk *= 2
+    return nb_iter, elapsed
+
+def bench_one(params : dict, min_time_s=1.0, warmup=1, lazy_from=8192, measure_memory=True, seed=42) -> dict:
+    """
+    Benchmark one point of the grid.
+
+    Args:
+        params: algorithm, nb_node, nb_link, and optionally backend and other
+            factory arguments replacing those of sim_params
+        min_time_s: time the iterations for at least this long
+        warmup: iterations run before timing (numba compiles on the first one)
+        lazy_from: see get_topo_func
+        measure_memory: also build and run once more under tracemalloc, for the peak
+            memory allocated by numpy and Python (not by numba's own allocator)
+
+    Returns:
+        times in seconds, iterations/s, node updates/s (nodes times iterations per
+        second) and peak memory in MB
+    """
+    algorithm, nb_node, nb_link = params["algorithm"], params["nb_node"], params["nb_link"]
+    topo_func = get_topo_func(algorithm, nb_node, lazy_from)
+    kwargs = dict(sim_params, topo_func=topo_func, seed=seed)
+    kwargs.update({name: value for name, value in params.items() if name not in ("algorithm", "nb_node", "nb_link")})
+    if topo_func is topo.opera_lazy:
+        kwargs["max_compiled_slices"] = 64
+    make = lambda: factories[algorithm](nb_node, nb_link, **kwargs)
+    result = {"topo": topo_func.__name__}
+
+    start = time.perf_counter()
+    topo.generate_compact_topo(nb_node, topo_func(rng=np.random.default_rng(seed), nb_node=nb_node, nb_link=nb_link))
+    result["topo_s"] = time.perf_counter() - start
+
+    # The simulator prints its sync count after every run
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        sim = make()
+        result["construct_s"] = time.perf_counter() - start
+        if warmup:
+            sim.run(warmup)
+        nb_iter, elapsed = run_timed(sim, min_time_s)
+        del sim
+
+        result["nb_iter"] = nb_iter
+        result["iter_s"] = elapsed / nb_iter
+        result["iters_per_s"] = nb_iter / elapsed
+        result["node_updates_per_s"] = nb_iter * nb_node / elapsed
+
+        if measure_memory:
+            tracemalloc.start()
+            try:
+                sim = make()
+                result["construct_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.reset_peak()
+                sim.run(max(warmup, 1))
+                result["run_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+                del sim
+            finally:
+                tracemalloc.stop()
+    return result
+
+def bench(grid=default_grid, out_path=None, **bench_args) -> dict:
+    """
+    Benchmark every point of the grid, one after the other.
+
+    A point that fails (e.g. a topology that does not exist for its size) gets its
+    error instead of measurements.
+
+    Args:
+        grid: see default_grid and sweep.expand_grid
+        out_path: write the report there as JSON, after every point
+        bench_args: see bench_one
+
+    Returns:
+        report: "version" (see version_info), "grid", "settings" and "results",
+        a list of the params of every point with its measurements
+    """
+    report = {"version": version_info(), "grid": grid, "settings": bench_args, "results": []}
+    for params in expand_grid(grid):
+        try:
+            measured = bench_one(params, **bench_args)
+        except Exception as e:
+            measured = {"error": f"{type(e).__name__}: {e}"}
+        report["results"].append({**params, **measured})
+        print(format_result(report["results"][-1]), flush=True)
+        if out_path is not None:
+            save_report(out_path, report)
+    return report
+
+def save_report(path, report : dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=1)
+    os.replace(tmp_path, path)
+
+def load_report(path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def result_key(result : dict) -> tuple:
+    return tuple(result.get(name) for name in default_grid)
+
+def format_result(result : dict) -> str:
+    name = " ".join(f"{result.get(name)}" for name in default_grid)
+    if "error" in result:
+        return f"{name}: {result['error']}"
+    memory = f" mem {result['construct_peak_mb']:.1f}/{result['run_peak_mb']:.1f} MB" if "run_peak_mb" in result else ""
+    return (f"{name} ({result['topo']}): topo {result['topo_s']:.3f}s build {result['construct_s']:.3f}s"
+            f" {result['iters_per_s']:.1f} it/s {result['node_updates_per_s']:.3g} node/s" + memory)
+
+def compare(old : dict, new : dict, threshold=0.2) -> list[tuple[dict, float]]:
+    """
+    Points of the grid where new is slower than old by more than threshold (a
+    fraction) in iterations/s or construction time.
+
+    Returns:
+        (result, slowdown) of every regression, slowdown = new time / old time
+    """
+    old_results = {result_key(result): result for result in old["results"] if "error" not in result}
+    regressions = []
+    for result in new["results"]:
+        previous = old_results.get(result_key(result))
+        if previous is None or "error" in result:
+            continue
+        slowdown = max(previous["iters_per_s"] / result["iters_per_s"], result["construct_s"] / previous["construct_s"])
+        if slowdown > 1 + threshold:
+            regressions.append((result, slowdown))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark simulator throughput")
+    parser.add_argument("--algorithm", nargs="+", default=default_grid["algorithm"])
+    parser.add_argument("--nb-node", nargs="+", type=int, default=default_grid["nb_node"])
+    parser.add_argument("--nb-link", nargs="+", type=int, default=default_grid["nb_link"])
+    parser.add_argument("--backend", nargs="+", default=default_grid["backend"])
+    parser.add_argument("--large", action="store_true", help=f"also benchmark {large_nb_node} nodes")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds of iterations per point")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--compare", help="report of an earlier version to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    report = bench(
+        grid={"algorithm": args.algorithm, "nb_node": args.nb_node + (large_nb_node if args.large else []),
+              "nb_link": args.nb_link, "backend": args.backend},
+        out_path=args.out,
+        min_time_s=args.min_time,
+        measure_memory=not args.no_memory,
+    )
+    if args.compare:
+        regressions = compare(load_report(args.compare), report, args.threshold)
+        for result, slowdown in regressions:
+            print(f"regression x{slowdown:.2f}: {format_result(result)}")
+        sys.exit(1 if regressions else 0)
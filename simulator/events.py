@@ -0,0 +1,242 @@
+# Event-driven simulation core
+
+import os
+import heapq
+
+import numpy as np
+
+import para
+from simulator import Simulator
+
+# Event kinds. Events at the same time run in this order: a record sees the
+# clocks right before the syncs of that time, like Simulator.run.
+RECORD, SLICE, SYNC = 0, 1, 2
+
+# Algorithms where every node pulls from its neighbors on its own
+pull_algos = {"syncwise", "graham", "syncwise_reference", "graham_reference"}
+
+class EventSimulator(Simulator):
+    """
+    Simulator driven by a heap of events instead of a fixed sync step.
+
+    Nodes sync at their own interval (sync_interval_ns may differ per node), slices
+    change every slice_duration_ns and clocks are recorded every record_interval_ns.
+    Nodes with the same interval and phase share one heap entry.
+
+    Drift is accumulated lazily: every node keeps the time its clock was last brought
+    up to date and only catches up, in closed form, when it is read (it or a neighbor
+    syncs) or recorded. By default the runtime drift variance of a node is drawn at each
+    of its syncs and holds until the next one, so the drift in between is linear. With
+    the same interval for every node this gives exactly the trajectories of
+    Simulator.run. With drift_redraw_ns the variance is instead redrawn every
+    drift_redraw_ns for every node, as Simulator.run does every sync interval, and the
+    sum of the draws a node skipped is drawn in one go (see para.sum_runtime_drift_variance).
+
+    Only algorithms where each node pulls from its neighbors (syncwise, graham) can run
+    on per-node events.
+    """
+
+    def __init__(
+            self,
+            name,
+            sync_algo,
+            nb_node,
+            nb_link,
+            topo_func,
+            drift_variance_bound : int,
+            drift_bound : int,
+            sync_interval_ns = 1,
+            sync_phase_ns = 0,
+            record_interval_ns = None,
+            sync_on_slice_change = False,
+            drift_redraw_ns = None,
+            **kwargs
+    ):
+        """
+        Args:
+            sync_interval_ns: sync interval, one for all nodes or one per node
+            sync_phase_ns: time of the first sync, one for all nodes or one per node
+            record_interval_ns: record clocks every record_interval_ns, by default the
+                shortest sync interval
+            sync_on_slice_change: additionally sync every node when a new slice starts
+            drift_redraw_ns: redraw the runtime drift variance of every node at this
+                interval instead of at each of its syncs
+            kwargs: see Simulator
+        """
+        intervals = np.broadcast_to(np.asarray(sync_interval_ns, dtype=np.int64), (nb_node,))
+        phases = np.broadcast_to(np.asarray(sync_phase_ns, dtype=np.int64), (nb_node,))
+        assert (intervals > 0).all() and (phases >= 0).all()
+        assert kwargs.get("topo_update_ts") is None, "Topology change is not supported with events"
+        super().__init__(name, sync_algo, nb_node, nb_link, topo_func, drift_variance_bound, drift_bound,
+                         sync_interval_ns=int(intervals.min()), **kwargs)
+        if self.sync_algo.__name__ not in pull_algos:
+            raise ValueError(f"{self.sync_algo.__name__} can not sync node by node, use Simulator")
+
+        self.record_interval_ns = self.sync_interval_ns if record_interval_ns is None else record_interval_ns
+        self.sync_on_slice_change = sync_on_slice_change
+        self.drift_redraw_ns = drift_redraw_ns
+        self.cur_time_ns = 0 # events are processed until here
+        self.run_end_ns = 0 # time the last run goes to, for resuming it
+        self.last_update_ns = np.zeros(nb_node, dtype=np.int64) # clock of each node is up to date until here
+        self.cur_slice_id = 0
+
+        self.runtime_drift_variance = np.zeros(self.drift_variance_bound.shape)
+        if drift_redraw_ns is not None:
+            self.runtime_drift_variance = self.get_runtime_drift_variance()
+        else:
+            # Runtime drift variance holds until the node syncs next. Nodes syncing at time 0 draw it then.
+            late = np.flatnonzero(phases > 0)
+            self.runtime_drift_variance[..., late] = para.get_runtime_drift_variance(
+                self.rng, self.drift_variance_bound[..., late])
+
+        # Nodes with the same interval and phase sync together
+        groups, group_of = np.unique(np.stack([intervals, phases], axis=1), axis=0, return_inverse=True)
+        group_of = group_of.ravel()
+        self.sync_groups = [np.flatnonzero(group_of == group) for group in range(len(groups))]
+        self.group_intervals = groups[:, 0]
+
+        self.events = [(int(phase), SYNC, group) for group, (_, phase) in enumerate(groups)]
+        self.events.append((self.slice_duration_ns, SLICE, -1))
+        self.events.append((self.record_interval_ns, RECORD, -1))
+        heapq.heapify(self.events)
+
+    def run(self, iter, checkpoint_path=None, checkpoint_every=None, resume=False):
+        """Run for iter record intervals
+
+        Args:
+            iter: number of record intervals
+            checkpoint_path, resume: see Simulator.run
+            checkpoint_every: also save a checkpoint every checkpoint_every record
+                intervals, the run goes on with run_until from each"""
+        if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self.load_checkpoint(checkpoint_path)
+        else:
+            self.run_end_ns = self.cur_time_ns + iter * self.record_interval_ns
+        step_ns = checkpoint_every * self.record_interval_ns if checkpoint_every else self.run_end_ns
+        while self.cur_time_ns < self.run_end_ns:
+            self.run_until(min(self.cur_time_ns + step_ns, self.run_end_ns))
+            if checkpoint_path is not None:
+                self.save_checkpoint(checkpoint_path)
+
+    def run_until(self, end_time_ns):
+        """Process all events up to end_time_ns, records at end_time_ns included"""
+        if not self.record_stats_only:
+            nb_record = (end_time_ns - self.cur_time_ns) // self.record_interval_ns + 1
+            self.error_record.reserve(nb_record, start_iter=self.nb_iter)
+            self.bound_record.reserve(nb_record, start_iter=self.nb_iter)
+
+        sync_count = 0
+        while self.events[0][:2] <= (end_time_ns, RECORD):
+            time_ns = self.events[0][0]
+            self.cur_time_ns = time_ns
+
+            syncing = []
+            while self.events[0][0] == time_ns and self.events[0][:2] <= (end_time_ns, RECORD):
+                _, kind, group = heapq.heappop(self.events)
+                if kind == RECORD:
+                    self.catch_up(time_ns)
+                    self.record()
+                    self.nb_iter += 1
+                    heapq.heappush(self.events, (time_ns + self.record_interval_ns, RECORD, -1))
+                elif kind == SLICE:
+                    self.cur_slice_id = self.schedule.get_slice_id(time_ns, self.slice_duration_ns)
+                    heapq.heappush(self.events, (time_ns + self.slice_duration_ns, SLICE, -1))
+                    if self.sync_on_slice_change:
+                        syncing.append(np.arange(self.nb_node))
+                else:
+                    syncing.append(self.sync_groups[group])
+                    heapq.heappush(self.events, (time_ns + int(self.group_intervals[group]), SYNC, group))
+
+            if syncing:
+                sync_count += self.sync_nodes(np.unique(np.concatenate(syncing)))
+
+        self.catch_up(end_time_ns)
+        self.cur_time_ns = end_time_ns
+        if self.result_writer is not None:
+            self.result_writer.flush()
+        print(f"{self.name} sync ctr: {sync_count}")
+
+    def state(self) -> tuple[dict[str, np.ndarray], dict]:
+        """State of Simulator, plus the pending events and the lazily updated clocks"""
+        arrays, meta = super().state()
+        arrays["events"] = np.array(self.events, dtype=np.int64).reshape(-1, 3)
+        arrays["last_update_ns"] = self.last_update_ns
+        arrays["runtime_drift_variance"] = self.runtime_drift_variance
+        meta["cur_slice_id"] = int(self.cur_slice_id)
+        meta["run_end_ns"] = int(self.run_end_ns)
+        return arrays, meta
+
+    def load_state(self, arrays : dict, meta : dict):
+        super().load_state(arrays, meta)
+        # The heap keeps its order
+        self.events = [tuple(event) for event in arrays["events"].tolist()]
+        self.last_update_ns = np.array(arrays["last_update_ns"])
+        self.runtime_drift_variance = np.array(arrays["runtime_drift_variance"])
+        self.cur_slice_id = meta["cur_slice_id"]
+        self.run_end_ns = meta["run_end_ns"]
+
+    def catch_up(self, time_ns, nodes=None):
+        """Bring the clocks of nodes (all by default) up to time_ns"""
+        if nodes is None:
+            nodes = np.arange(self.nb_node)
+        nodes = nodes[self.last_update_ns[nodes] < time_ns]
+        if not len(nodes):
+            return
+        duration_ns = time_ns - self.last_update_ns[nodes]
+
+        if self.drift_redraw_ns is None:
+            # Variance is constant since the last update
+            rate = self.runtime_drift_variance[..., nodes]
+            if not self.offset_drift:
+                rate = self.drift_rate[..., nodes] + rate
+            error_drift = rate * duration_ns
+        else:
+            error_drift = self.integrate_runtime_drift_variance(nodes, self.last_update_ns[nodes], time_ns)
+            if not self.offset_drift:
+                error_drift = error_drift + self.drift_rate[..., nodes] * duration_ns
+        bound_rate = self.drift_variance_bound[..., nodes]
+        if not self.offset_drift:
+            bound_rate = self.drift_rate[..., nodes] + bound_rate
+
+        self.cur_error[..., nodes] = self.cur_error[..., nodes] + error_drift / 1e6
+        self.cur_bound[..., nodes] = self.cur_bound[..., nodes] + bound_rate * duration_ns / 1e6
+        # node 0 is the reference
+        self.cur_error[..., 0] = 0
+        self.cur_bound[..., 0] = 0
+        self.last_update_ns[nodes] = time_ns
+
+    def integrate_runtime_drift_variance(self, nodes, start_ns, end_ns):
+        """
+        Integral of the runtime drift variance of nodes from start_ns (per node) to
+        end_ns, when it is redrawn at every multiple of drift_redraw_ns. The draws of
+        the periods in between are summed in one go and the variance of the last,
+        unfinished period is kept for the next catch up.
+        """
+        period = self.drift_redraw_ns
+        start_period, end_period = start_ns // period, end_ns // period
+        rate = self.runtime_drift_variance[..., nodes]
+        integral = rate * (end_ns - start_ns)
+
+        redrawn = end_period > start_period
+        if redrawn.any():
+            idx = np.flatnonzero(redrawn)
+            bound = self.drift_variance_bound[..., nodes[idx]]
+            nb_skipped = end_period - start_period[idx] - 1 # whole periods in between
+            new_rate = para.get_runtime_drift_variance(self.rng, bound)
+            skipped = para.sum_runtime_drift_variance(self.rng, bound, nb_skipped)
+            integral[..., idx] = (rate[..., idx] * ((start_period[idx] + 1) * period - start_ns[idx])
+                                  + skipped * period
+                                  + new_rate * (end_ns - end_period * period))
+            self.runtime_drift_variance[..., nodes[idx]] = new_rate
+        return integral
+
+    def sync_nodes(self, nodes : np.ndarray) -> int:
+        """The given nodes sync with their neighbors in the current slice"""
+        cur_topo = self.schedule[self.cur_slice_id].restrict(nodes)
+        # Syncing nodes read their own clocks and their neighbors'
+        self.catch_up(self.cur_time_ns, np.union1d(nodes, cur_topo.csr[2]))
+        sync_count = self.sync(cur_topo)
+        if self.drift_redraw_ns is None:
+            self.runtime_drift_variance[..., nodes] = para.get_runtime_drift_variance(
+                self.rng, self.drift_variance_bound[..., nodes])
+        return sync_count
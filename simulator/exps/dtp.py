@@ -8,14 +8,15 @@ import topo, algo, para as para
 from utils import draw_cdf
 
 
-def dtp(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_bound=None, hop_error_bound=None):
+def dtp(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_bound=None, hop_error_bound=None,
+        topo_func=topo.static_tree, **kwargs):
     sim = Simulator(
         name="dtp",
         sync_algo=algo.dtp,
         nb_node=nb_node,
         nb_link=nb_link,
         #topo_func=topo.opera,
-        topo_func=topo.static_tree,
+        topo_func=topo_func,
         #topo_func=topo.shale,
         drift_bound=d_bound,
         drift_variance_bound=dv_bound,
@@ -23,6 +24,7 @@ def dtp(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_
         sync_interval_ns=sync_interval_ns,
         slice_duration_ns=slice_duration_ns,
         offset_drift=False,
+        **kwargs
     )
 
     return sim
@@ -54,12 +56,11 @@ if __name__ == "__main__":
     nb_link = 4
 
     sim = dtp(
-        nb_node, nb_link, sync_interval_ns=100 * 1000, slice_duration_ns=100 * 1000
+        nb_node, nb_link, sync_interval_ns=100 * 1000, slice_duration_ns=100 * 1000,
+        result_dir="results/dtp", result_mode="overwrite"
     )
 
     sim.run(iter=100)
-    import numpy as np
-    print(np.round(sim.get_clock_errors(),2))
     draw_cdf({"dtp": sim.get_clock_errors()}, name="dtp")
     import matplotlib.pyplot as plt
     plt.show()
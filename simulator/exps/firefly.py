@@ -9,7 +9,8 @@ import topo, algo, para as para
 from utils import draw_cdf
 
 
-def firefly(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_bound=None, hop_error_bound=None):
+def firefly(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_bound=None, hop_error_bound=None,
+            topo_func=topo.static_tree, **kwargs):
     sim = Simulator(
         name="firefly",
         sync_algo=algo.firefly,
@@ -17,13 +18,14 @@ def firefly(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None,
         nb_node=nb_node,
         nb_link=nb_link,
         #topo_func=topo.opera,
-        topo_func=topo.static_tree,
+        topo_func=topo_func,
         drift_bound=d_bound,
         drift_variance_bound=dv_bound,
         hop_error_bound=hop_error_bound,
         sync_interval_ns=sync_interval_ns,
         slice_duration_ns=slice_duration_ns,
-        offset_drift=True
+        offset_drift=True,
+        **kwargs
     )
 
     return sim
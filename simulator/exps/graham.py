@@ -7,19 +7,21 @@ from simulator import Simulator
 import topo, algo, para as para
 
 
-def graham(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_bound=None, hop_error_bound=None):
+def graham(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_bound=None, hop_error_bound=None,
+           topo_func=topo.opera, **kwargs):
     sim = Simulator(
         name="graham",
         sync_algo=algo.graham,
         nb_node=nb_node,
         nb_link=nb_link,
-        topo_func=topo.opera,
+        topo_func=topo_func,
         drift_bound=d_bound,
         drift_variance_bound=dv_bound,
         hop_error_bound=hop_error_bound,
         sync_interval_ns=sync_interval_ns,
         slice_duration_ns=slice_duration_ns,
         offset_drift=True,
+        **kwargs
     )
 
     return sim
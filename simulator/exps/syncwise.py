@@ -8,13 +8,13 @@ import topo, algo, para as para
 
 
 def syncwise(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_bound=None, hop_error_bound=None,
-             failed_node=[], failed_link=[]):
+             failed_node=[], failed_link=[], topo_func=topo.opera, **kwargs):
     sim = Simulator(
         name="syncwise",
         sync_algo=algo.syncwise,
         nb_node=nb_node,
         nb_link=nb_link,
-        topo_func=topo.opera,
+        topo_func=topo_func,
         #topo_func=topo.shale,
         drift_bound=d_bound,
         drift_variance_bound=dv_bound,
@@ -23,7 +23,8 @@ def syncwise(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None
         slice_duration_ns=slice_duration_ns,
         offset_drift=True,
         failed_node=failed_node,
-        failed_link=failed_link
+        failed_link=failed_link,
+        **kwargs
     )
 
     return sim
@@ -31,7 +32,7 @@ def syncwise(nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None
 def syncwise_skew(
         nb_node, nb_link, sync_interval_ns, slice_duration_ns, d_bound=None, dv_bound=None, hop_error_bound=None,
         topo_arg=None,topo_update_ts=None,
-        failed_node=[], failed_link=[]):
+        failed_node=[], failed_link=[], **kwargs):
     
     sim = Simulator(
         name="syncwise",
@@ -49,7 +50,8 @@ def syncwise_skew(
         slice_duration_ns=slice_duration_ns,
         offset_drift=True,
         failed_node=failed_node,
-        failed_link=failed_link
+        failed_link=failed_link,
+        **kwargs
     )
 
     return sim
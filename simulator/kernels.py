@@ -0,0 +1,225 @@
+# Numba-compiled sync algorithms
+#
+# Same signatures and results as the ones in algo.py: each kernel walks the CSR
+# adjacency node by node like the *_reference loops and draws from the same
+# np.random.Generator (numba shares its bit generator state), so for a given
+# seed every backend produces the same trajectories. With a para.NoiseProvider,
+# the hop errors come from its noise models instead: the wrappers draw them from
+# the provider in the order of the array versions and hand them to the kernels.
+
+import numpy as np
+from numba import njit
+
+import utils
+import para
+
+@njit(cache=True)
+def _hop_error(rng, hop_error_bound):
+    err = rng.normal(0.0, hop_error_bound / 3)
+    return min(max(err, -hop_error_bound), hop_error_bound)
+
+@njit(cache=True)
+def _next_hop_error(rng, noise, k, hop_error_bound):
+    # The k-th hop error of a kernel call: given in noise, or drawn when noise is empty
+    if len(noise):
+        return noise[k]
+    return _hop_error(rng, hop_error_bound)
+
+@njit(cache=True)
+def _syncwise(rng, noise, nodes, indptr, indices, prev_error, prev_bound, hop_error_bound,
+              now_error, now_bound, path_length_tracker, synced, sources):
+    sync_count = 0
+    for row in range(len(nodes)):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        chosen_neighbor = indices[start]
+        min_neighbor_bound = prev_bound[chosen_neighbor]
+        for pos in range(start + 1, end):
+            if prev_bound[indices[pos]] < min_neighbor_bound:
+                chosen_neighbor = indices[pos]
+                min_neighbor_bound = prev_bound[chosen_neighbor]
+
+        node = nodes[row]
+        if prev_bound[node] > min_neighbor_bound + hop_error_bound:
+            now_bound[node] = min_neighbor_bound + hop_error_bound
+            now_error[node] = prev_error[chosen_neighbor] + _next_hop_error(rng, noise, sync_count, hop_error_bound)
+            synced[sync_count], sources[sync_count] = node, chosen_neighbor
+            sync_count += 1
+            path_length_tracker[node] = path_length_tracker[chosen_neighbor] + 1
+    return sync_count
+
+@njit(cache=True)
+def _dtp(rng, noise, nodes, indptr, indices, prev_error, hop_error_bound, now_error):
+    k = 0
+    for row in range(len(nodes)):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        max_neighbor_error = prev_error[indices[start]]
+        for pos in range(start + 1, end):
+            max_neighbor_error = max(max_neighbor_error, prev_error[indices[pos]])
+        now_error[nodes[row]] = max_neighbor_error + _next_hop_error(rng, noise, k, hop_error_bound)
+        k += 1
+
+@njit(cache=True)
+def _graham(rng, noise, nodes, indptr, indices, hop_error_bound, now_error, now_bound):
+    sync_count = 0
+    for row in range(len(nodes)):
+        for pos in range(indptr[row], indptr[row + 1]):
+            if indices[pos] == 0:
+                now_bound[nodes[row]] = hop_error_bound
+                now_error[nodes[row]] = _next_hop_error(rng, noise, sync_count, hop_error_bound)
+                sync_count += 1
+                break
+    return sync_count
+
+@njit(cache=True)
+def _spanning_tree(rng, noise, nodes, indptr, indices, prev_error, prev_bound, hop_error_bound,
+                   now_error, now_bound, path_length_tracker, synced, sources):
+    nb_id = max(nodes.max(), 0) + 1
+    row_of = np.full(nb_id, -1)
+    for row in range(len(nodes)):
+        row_of[nodes[row]] = row
+    visited = np.zeros(nb_id, dtype=np.bool_)
+    queue = np.empty(len(nodes), dtype=np.int64)
+    queue[0] = 0
+    visited[0] = True
+    head, tail = 0, 1
+    sync_count = 0
+    while head < tail:
+        src = queue[head]
+        head += 1
+        row = row_of[src]
+        for pos in range(indptr[row], indptr[row + 1]):
+            dst = indices[pos]
+            if visited[dst]:
+                continue
+            visited[dst] = True
+            queue[tail] = dst
+            tail += 1
+            now_bound[dst] = prev_bound[src] + hop_error_bound
+            now_error[dst] = prev_error[src] + _next_hop_error(rng, noise, sync_count, hop_error_bound)
+            synced[sync_count], sources[sync_count] = dst, src
+            sync_count += 1
+            path_length_tracker[dst] = path_length_tracker[src] + 1
+    return sync_count
+
+@njit(cache=True)
+def _firefly_optimized(rng, noise, nodes, indptr, indices, prev_error, hop_error_bound, now_error):
+    for row in range(len(nodes)):
+        hop_error = _next_hop_error(rng, noise, row, hop_error_bound)
+        error_sum = 0.0
+        noise_sum = 0.0
+        for pos in range(indptr[row], indptr[row + 1]):
+            error_sum += prev_error[indices[pos]]
+            noise_sum += hop_error
+        now_error[nodes[row]] = (error_sum + noise_sum) / (indptr[row + 1] - indptr[row])
+
+def _replicas(arr : np.ndarray) -> np.ndarray:
+    return arr.reshape(-1, arr.shape[-1])
+
+def _provider_noise(rng, nb_replica, nb_draw, hop_error_bound) -> np.ndarray:
+    """
+    Hop errors of a kernel call known to make nb_draw draws per replica, one row per
+    replica: from the models of a para.NoiseProvider, or empty rows (the kernels draw
+    from the generator) for a plain generator.
+    """
+    if not isinstance(rng, para.NoiseProvider):
+        return np.empty((nb_replica, 0))
+    return para.get_hop_errors(rng, (nb_replica, nb_draw), hop_error_bound)
+
+def _deferred_noise(rng, nb_node):
+    """
+    Placeholder hop errors of a kernel call making an unknown number of draws: zeros
+    with a para.NoiseProvider, the actual ones are added by _add_deferred_noise once
+    the synced nodes are known, none (the kernels draw themselves) otherwise.
+    """
+    return np.zeros(nb_node if isinstance(rng, para.NoiseProvider) else 0)
+
+def _add_deferred_noise(rng, now_error, synced, hop_error_bound):
+    """Add the hop errors of the synced nodes (flat indices, in sync order) with a para.NoiseProvider"""
+    if isinstance(rng, para.NoiseProvider) and len(synced):
+        flat_error = now_error.reshape(-1)
+        flat_error[synced] += para.get_hop_errors(rng, len(synced), hop_error_bound)
+
+def _count_path_length(path_length_counter, replica, tracker, synced, sources):
+    """Count the syncs of one replica, the first ones in synced and sources"""
+    offset = replica * len(tracker)
+    path_length_counter.add(tracker[synced], offset + synced, offset + sources)
+
+def syncwise(rng, cur_error, cur_bound, cur_topo, hop_error_bound, path_length_tracker, path_length_counter):
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    now_error = cur_error.astype(float)
+    now_bound = cur_bound.astype(float)
+    noise = _deferred_noise(rng, len(nodes))
+    synced, sources = np.empty(len(nodes), dtype=np.int64), np.empty(len(nodes), dtype=np.int64)
+    all_synced = []
+    sync_count = 0
+    # Replicas sync one after another, the same as the batched array version
+    for replica, (prev_error, prev_bound, error, bound, tracker) in enumerate(zip(
+            _replicas(cur_error).astype(float), _replicas(cur_bound).astype(float),
+            _replicas(now_error), _replicas(now_bound), _replicas(path_length_tracker))):
+        count = _syncwise(para.generator(rng), noise, nodes, indptr, indices, prev_error, prev_bound,
+                          float(hop_error_bound), error, bound, tracker, synced, sources)
+        sync_count += count
+        _count_path_length(path_length_counter, replica, tracker, synced[:count], sources[:count])
+        all_synced.append(replica * len(tracker) + synced[:count])
+    _add_deferred_noise(rng, now_error, np.concatenate(all_synced), hop_error_bound)
+    return now_error, now_bound, sync_count
+
+def dtp(rng, cur_error, cur_bound, cur_topo, hop_error_bound):
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    has_neighbor = np.diff(indptr) > 0
+    for node in nodes[~has_neighbor]:
+        print(f"{node=} has no neighbors")
+    now_error = cur_error.astype(float)
+    noise = _provider_noise(rng, len(_replicas(now_error)), np.count_nonzero(has_neighbor), hop_error_bound)
+    for prev_error, error, replica_noise in zip(_replicas(cur_error).astype(float), _replicas(now_error), noise):
+        _dtp(para.generator(rng), replica_noise, nodes, indptr, indices, prev_error, float(hop_error_bound), error)
+
+    # DTP does internal sync
+    now_error = now_error - np.average(now_error, axis=-1, keepdims=True)
+    return now_error, cur_bound.copy(), 0
+
+def graham(rng, cur_error, cur_bound, cur_topo, hop_error_bound):
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    now_error = cur_error.astype(float)
+    now_bound = cur_bound.astype(float)
+    # Nodes next to the master sync, once each
+    nb_synced = len(np.unique(np.repeat(np.arange(len(nodes)), np.diff(indptr))[indices == 0]))
+    noise = _provider_noise(rng, len(_replicas(now_error)), nb_synced, hop_error_bound)
+    sync_count = 0
+    for error, bound, replica_noise in zip(_replicas(now_error), _replicas(now_bound), noise):
+        sync_count += _graham(para.generator(rng), replica_noise, nodes, indptr, indices, float(hop_error_bound), error, bound)
+    return now_error, now_bound, sync_count
+
+def spanning_tree(rng, cur_error, cur_bound, cur_topo, hop_error_bound, path_length_tracker, path_length_counter):
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    now_error = cur_error.astype(float)
+    now_bound = cur_bound.astype(float)
+    noise = _deferred_noise(rng, len(nodes))
+    synced, sources = np.empty(len(nodes), dtype=np.int64), np.empty(len(nodes), dtype=np.int64)
+    all_synced = []
+    sync_count = 0
+    for replica, (prev_error, prev_bound, error, bound, tracker) in enumerate(zip(
+            _replicas(cur_error).astype(float), _replicas(cur_bound).astype(float),
+            _replicas(now_error), _replicas(now_bound), _replicas(path_length_tracker))):
+        count = _spanning_tree(para.generator(rng), noise, nodes, indptr, indices, prev_error, prev_bound,
+                               float(hop_error_bound), error, bound, tracker, synced, sources)
+        sync_count += count
+        _count_path_length(path_length_counter, replica, tracker, synced[:count], sources[:count])
+        all_synced.append(replica * len(tracker) + synced[:count])
+    _add_deferred_noise(rng, now_error, np.concatenate(all_synced), hop_error_bound)
+    return now_error, now_bound, sync_count
+
+def firefly_optimized(rng, cur_error, cur_bound, cur_topo, hop_error_bound):
+    nodes, indptr, indices = utils.get_csr(cur_topo)
+    now_error = cur_error.astype(float)
+    noise = _provider_noise(rng, len(_replicas(now_error)), len(nodes), hop_error_bound)
+    for prev_error, error, replica_noise in zip(_replicas(cur_error).astype(float), _replicas(now_error), noise):
+        _firefly_optimized(para.generator(rng), replica_noise, nodes, indptr, indices, prev_error, float(hop_error_bound), error)
+
+    # Cailibrate error viewing for the ease of debugging
+    now_error = now_error - np.average(now_error, axis=-1, keepdims=True)
+    return now_error, cur_bound, 0
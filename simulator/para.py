@@ -1,3 +1,5 @@
+import re
+
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -6,23 +8,274 @@ default_drift_variance_bound = 50
 hop_error_bound = 5
 #rng = np.random.default_rng(seed=42)  # set the seed
 
+# Distributions of the noise components, as draws in [-1, 1] that are scaled by the bound
+def unit_clipped_normal(rng, size):
+    # normal with 3 sigma at the bound, clipped to it
+    return np.clip(rng.normal(loc=0.0, scale=1/3, size=size), -1, 1)
+
+def unit_uniform(rng, size):
+    return rng.uniform(-1, 1, size=size)
+
+def unit_biased_uniform(rng, size):
+    # only slows clocks down, up to twice the bound
+    return rng.uniform(-2, 0, size=size)
+
+def unit_normal(rng, size):
+    # normal with sigma at the bound, not clipped
+    return rng.normal(loc=0.0, scale=1.0, size=size)
+
+class EmpiricalModel:
+    """
+    Distribution of measured samples, e.g. PHC offsets of a trace, sampled through an
+    inverse-CDF lookup table: a uniform draw picks a position in the table of quantiles
+    and is interpolated linearly between its two neighbors.
+    """
+
+    def __init__(self, samples, scale = None, nb_bin = 4096):
+        """
+        Args:
+            samples: measured values
+            scale: samples are divided by scale to make unit draws, by default their
+                largest magnitude so that draws stay within the bound
+            nb_bin: quantiles in the lookup table
+        """
+        samples = np.asarray(samples, dtype=float).ravel()
+        assert len(samples), "No samples"
+        if scale is None:
+            scale = np.abs(samples).max() or 1.0
+        self.quantiles = np.quantile(samples / scale, np.linspace(0, 1, nb_bin + 1))
+
+    @classmethod
+    def from_trace(cls, path, **kwargs) -> "EmpiricalModel":
+        """Model of the offsets in a trace file, see load_trace"""
+        return cls(load_trace(path), **kwargs)
+
+    def __call__(self, rng, size):
+        pos = rng.uniform(0, len(self.quantiles) - 1, size=size)
+        low = np.minimum(pos.astype(np.int64), len(self.quantiles) - 2)
+        return self.quantiles[low] + (pos - low) * (self.quantiles[low + 1] - self.quantiles[low])
+
+class DiscreteModel:
+    """Distribution over a few values, sampled in O(1) per draw with an alias table (Vose)"""
+
+    def __init__(self, values, weights = None):
+        """
+        Args:
+            values: unit values
+            weights: relative probability of each value, equal by default
+        """
+        self.values = np.asarray(values, dtype=float)
+        nb_value = len(self.values)
+        weights = np.ones(nb_value) if weights is None else np.asarray(weights, dtype=float)
+        prob = weights * nb_value / weights.sum()
+        self.prob = np.ones(nb_value)
+        self.alias = np.arange(nb_value)
+        small = [i for i in range(nb_value) if prob[i] < 1]
+        large = [i for i in range(nb_value) if prob[i] >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less], self.alias[less] = prob[less], more
+            prob[more] -= 1 - prob[less]
+            (small if prob[more] < 1 else large).append(more)
+
+    def __call__(self, rng, size):
+        column = rng.integers(0, len(self.values), size=size)
+        keep = rng.random(size=size) < self.prob[column]
+        return self.values[np.where(keep, column, self.alias[column])]
+
+def load_trace(path) -> np.ndarray:
+    """
+    Offsets (ns) of a measured trace: a .npy file, a text file with one value per line,
+    or a ptp4l / phc2sys log, from which the value after every "offset" is taken.
+    """
+    if str(path).endswith(".npy"):
+        return np.load(path).ravel()
+    with open(path) as f:
+        text = f.read()
+    offsets = re.findall(r"offset\s+(-?\d+(?:\.\d+)?)", text)
+    if offsets:
+        return np.array(offsets, dtype=float)
+    return np.loadtxt(path, ndmin=1).ravel()
+
+# Named noise models, to be selected per component with noise_distributions
+noise_models = {
+    "uniform": unit_uniform,
+    "biased_uniform": unit_biased_uniform,
+    "choice": DiscreteModel([-1, 1, 1]),
+    "normal": unit_normal,
+    "clipped_normal": unit_clipped_normal,
+}
+
+def register_noise_model(name, model):
+    """Make a model (function(rng, size) of unit draws) selectable by name"""
+    noise_models[name] = model
+
+def get_noise_model(model):
+    """A model given by name or as a function"""
+    if callable(model):
+        return model
+    if model not in noise_models:
+        raise ValueError(f"Unknown noise model {model}, choose from {list(noise_models)}")
+    return noise_models[model]
+
+noise_distributions = {
+    "hop_error": unit_clipped_normal,
+    "path_asymmetry": unit_uniform,
+    "drift_variance": unit_uniform,
+}
+
+class NoiseProvider:
+    """
+    Random variates of the noise components (hop errors, path asymmetries, runtime drift
+    variances) handed out from pre-generated blocks.
+
+    Every component has its own buffer of unit draws from its distribution, refilled a
+    block at a time from the generator and scaled by the bound of each draw. The
+    provider can be passed anywhere a np.random.Generator is expected: the get_*
+    functions below draw from its buffers, other Generator methods go to the generator.
+    """
+
+    def __init__(self, rng : np.random.Generator, block_size = 1 << 16, distributions = None):
+        """
+        Args:
+            rng: generator the blocks are drawn from
+            block_size: unit draws generated per refill of a component
+            distributions: component -> model, a name in noise_models or a
+                function(rng, size) of unit draws, replacing the ones of noise_distributions
+        """
+        self.rng = rng
+        self.block_size = block_size
+        self.distributions = dict(noise_distributions)
+        if distributions is not None:
+            unknown = set(distributions) - set(noise_distributions)
+            assert not unknown, f"Unknown noise components {unknown}"
+            self.distributions.update({component: get_noise_model(model) for component, model in distributions.items()})
+        self.buffers = {component: np.empty(0) for component in self.distributions}
+        self.positions = {component: 0 for component in self.distributions}
+
+    def __getattr__(self, name):
+        # choice, integers, shuffle, ... of the generator. Only called for missing
+        # attributes: rng itself is missing while copy or pickle rebuild the provider.
+        if name == "rng" or (name.startswith("__") and name.endswith("__")):
+            raise AttributeError(name)
+        return getattr(self.rng, name)
+
+    def draw(self, component, size) -> np.ndarray:
+        """Unit draws of a component, of the given size (int or shape). A read-only view of the buffer."""
+        count = int(np.prod(size))
+        buffer, pos = self.buffers[component], self.positions[component]
+        if pos + count > len(buffer):
+            # Keep what is left and append a new block
+            block = self.distributions[component](self.rng, max(self.block_size, count - (len(buffer) - pos)))
+            buffer = np.concatenate([buffer[pos:], block])
+            buffer.flags.writeable = False
+            self.buffers[component], pos = buffer, 0
+        self.positions[component] = pos + count
+        return buffer[pos:pos + count].reshape(size)
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Draws of every component not handed out yet. The generator state is kept by the caller."""
+        return {component: self.buffers[component][self.positions[component]:] for component in self.buffers}
+
+    def load_state(self, state : dict):
+        for component, buffer in state.items():
+            buffer = np.array(buffer, dtype=float)
+            buffer.flags.writeable = False
+            self.buffers[component], self.positions[component] = buffer, 0
+
+    def hop_errors(self, size, hop_error_bound):
+        return hop_error_bound * self.draw("hop_error", size)
+
+    def path_asymmetries(self, size, asymmetry_bound):
+        return asymmetry_bound * self.draw("path_asymmetry", size)
+
+    def runtime_drift_variance(self, drift_variance_bound_list):
+        bound = np.asarray(drift_variance_bound_list)
+        return bound * self.draw("drift_variance", bound.shape)
+
+def generator(rng) -> np.random.Generator:
+    """The np.random.Generator behind rng, which may be a NoiseProvider"""
+    return rng.rng if isinstance(rng, NoiseProvider) else rng
+
 def get_hop_error(rng, hop_error_bound = hop_error_bound):
+    if isinstance(rng, NoiseProvider):
+        return rng.hop_errors((), hop_error_bound)[()]
     err = rng.normal(loc=0.0, scale=hop_error_bound/3)
     return np.clip(err, -hop_error_bound, hop_error_bound)
     return err
 
+def get_hop_errors(rng, size, hop_error_bound = hop_error_bound):
+    # Same stream as calling get_hop_error() size times. size may be a shape
+    if isinstance(rng, NoiseProvider):
+        return rng.hop_errors(size, hop_error_bound)
+    err = rng.normal(loc=0.0, scale=hop_error_bound/3, size=size)
+    return np.clip(err, -hop_error_bound, hop_error_bound)
+
 def get_path_asymmetry(rng, asymmetry_bound = 10):
     # path asymmetry incurred when sync through multiple hops
     # +-20ns is the filterred value considering queuing and link length difference in DCNs
+    if isinstance(rng, NoiseProvider):
+        return rng.path_asymmetries((), asymmetry_bound)[()]
     err = rng.uniform(-asymmetry_bound, asymmetry_bound)
     return err
+def get_path_asymmetries(rng, size, asymmetry_bound = 10):
+    # Same distribution as calling get_path_asymmetry() size times. size may be a shape
+    if isinstance(rng, NoiseProvider):
+        return rng.path_asymmetries(size, asymmetry_bound)
+    return rng.uniform(-asymmetry_bound, asymmetry_bound, size=size)
 def get_runtime_drift_variance(rng, drift_variance_bound_list):
-    runtime_drift_variance = np.array([rng.uniform(-bound, bound) for bound in drift_variance_bound_list])
+    # One draw per node in order, any shape of bounds
+    if isinstance(rng, NoiseProvider):
+        return rng.runtime_drift_variance(drift_variance_bound_list)
+    runtime_drift_variance = rng.uniform(-drift_variance_bound_list, drift_variance_bound_list)
     #runtime_drift_variance = np.array([rng.uniform(-bound*2, bound*0) for bound in drift_variance_bound_list])
     #runtime_drift_variance = np.array([rng.choice([-bound, bound, bound]) for bound in drift_variance_bound_list])
     #runtime_drift_variance = np.array([rng.normal(loc=0.0, scale=bound) for bound in drift_variance_bound_list])
     #print(f"{runtime_drift_variance=}")
     return runtime_drift_variance
+# Exact moments of the models that have them, see unit_moments
+_model_moments = {
+    unit_uniform: (0.0, 1/3, -1.0, 1.0),
+    unit_biased_uniform: (-1.0, 1/3, -2.0, 0.0),
+}
+
+def unit_moments(model, nb_sample = 1 << 20) -> tuple[float, float, float, float]:
+    """
+    Mean, variance, min and max of the unit draws of a model. Unless known, they are
+    estimated once from a sample of a generator of its own, so that the simulation's
+    generator is left alone.
+    """
+    if model not in _model_moments:
+        draws = np.asarray(model(np.random.default_rng(0), nb_sample), dtype=float)
+        _model_moments[model] = (draws.mean(), draws.var(), draws.min(), draws.max())
+    return _model_moments[model]
+
+def sum_runtime_drift_variance(rng, drift_variance_bound_list, nb_draw, nb_exact=8):
+    """
+    Sum of nb_draw (per node) runtime drift variances, drawn in one batch.
+
+    Up to nb_exact draws are summed exactly, larger sums are drawn from the normal
+    distribution with the same mean and variance (nb_draw times those of one draw
+    of the drift variance model, see unit_moments), clipped to the range of the sum.
+    """
+    bound = np.asarray(drift_variance_bound_list, dtype=float)
+    nb_draw = np.broadcast_to(nb_draw, bound.shape[-1:])
+    exact = nb_draw <= nb_exact
+    total = np.zeros(bound.shape)
+    if exact.any():
+        nb_max = int(nb_draw[exact].max())
+        draws = get_runtime_drift_variance(rng, np.broadcast_to(bound[..., exact], (nb_max,) + bound[..., exact].shape))
+        mask = np.arange(nb_max)[:, None] < nb_draw[exact]
+        if draws.ndim > 2:
+            mask = mask[:, None, :]
+        total[..., exact] = np.sum(draws * mask, axis=0)
+    if not exact.all():
+        model = rng.distributions["drift_variance"] if isinstance(rng, NoiseProvider) else unit_uniform
+        mean, var, low, high = unit_moments(model)
+        scale, nb = bound[..., ~exact], nb_draw[~exact]
+        total[..., ~exact] = np.clip(rng.normal(mean * scale * nb, scale * np.sqrt(nb * var)),
+                                     low * scale * nb, high * scale * nb)
+    return total
 def gen_normal_distribution(rng, nb_node, d, bound=200):
     """Generate gauss distribution and clip
     """
@@ -31,31 +284,35 @@ def gen_normal_distribution(rng, nb_node, d, bound=200):
     #arr = np.clip(arr, -bound, bound)
     
     return arr
-def gen_drift(rng, nb_node, drift_bound):
+def node_shape(nb_node, replicas = None):
+    """Shape of per-node parameters, with a leading replica axis if replicas is set"""
+    return nb_node if replicas is None else (replicas, nb_node)
+
+def gen_drift(rng, nb_node, drift_bound, replicas = None):
     """max 200ppm"""
     if drift_bound == None:
         drift_bound = 40
-    drift = gen_normal_distribution(rng, nb_node=nb_node, d = drift_bound)
-    drift[0] = 0
+    drift = gen_normal_distribution(rng, nb_node=node_shape(nb_node, replicas), d = drift_bound)
+    drift[..., 0] = 0
     return drift
 
-def gen_drift_variance(rng, nb_node, dv_bound = None):
+def gen_drift_variance(rng, nb_node, dv_bound = None, replicas = None):
     """max 
     source: Graham, NSDI'22"""
     if dv_bound is None:
         dv_bound = default_drift_variance_bound
-    dv = rng.uniform(0, dv_bound, size = nb_node)
-    dv[0] = 0
+    dv = rng.uniform(0, dv_bound, size = node_shape(nb_node, replicas))
+    dv[..., 0] = 0
     return dv
 
-def gen_drift_variance_tree(rng, nb_node, dv_bound = None):
+def gen_drift_variance_tree(rng, nb_node, dv_bound = None, replicas = None):
     """max 
     source: Graham, NSDI'22"""
     if dv_bound is None:
         dv_bound = default_drift_variance_bound
-    dv = rng.uniform(0, dv_bound, size = nb_node)
-    dv[1:] = np.sort(dv[1:])[::-1]
-    dv[0] = 0
+    dv = rng.uniform(0, dv_bound, size = node_shape(nb_node, replicas))
+    dv[..., 1:] = np.sort(dv[..., 1:], axis=-1)[..., ::-1]
+    dv[..., 0] = 0
     #dv = np.abs(gen_normal_distribution(rng=rng, nb_node=nb_node, bound=dv_bound, three_d=dv_bound))
     #dv = dv_bound - dv
     #dv = np.array([dv_bound] * nb_node)
@@ -0,0 +1,88 @@
+# Preallocated per-iteration recording of node values
+
+import numpy as np
+
+class Recorder:
+    """
+    Records one row of node values per sync iteration into a preallocated array.
+
+    Args:
+        width: number of values per row, or the shape of a row
+        stride: only record every stride-th iteration
+        last: if set, only keep the last rows. Rows are written twice into a
+            buffer of 2 * last rows so the kept rows are always contiguous.
+    """
+
+    def __init__(self, width, stride=1, last=None):
+        assert stride >= 1
+        assert last is None or last >= 1
+        self.width = width if isinstance(width, tuple) else (width,)
+        self.stride = stride
+        self.last = last
+        self.nb_row = 0 # rows recorded so far
+        capacity = 2 * last if last is not None else 0
+        self.data = np.empty((capacity,) + self.width)
+        self.iterations = np.empty(capacity, dtype=np.int64)
+
+    def reserve(self, nb_iter, start_iter=0):
+        """Make room for the rows of nb_iter more iterations starting from start_iter"""
+        if self.last is not None:
+            return
+        first = -(-start_iter // self.stride)
+        last = -(-(start_iter + nb_iter) // self.stride)
+        self._grow(self.nb_row + last - first)
+
+    def _grow(self, capacity):
+        if capacity > len(self.data):
+            data = np.empty((capacity,) + self.width)
+            data[:self.nb_row] = self.data[:self.nb_row]
+            iterations = np.empty(capacity, dtype=np.int64)
+            iterations[:self.nb_row] = self.iterations[:self.nb_row]
+            self.data, self.iterations = data, iterations
+
+    def record(self, iteration, values):
+        if iteration % self.stride != 0:
+            return
+        if self.last is None:
+            if self.nb_row == len(self.data):
+                self._grow(max(2 * self.nb_row, 1))
+            self.data[self.nb_row] = values
+            self.iterations[self.nb_row] = iteration
+        else:
+            pos = self.nb_row % self.last
+            self.data[pos] = values
+            self.data[pos + self.last] = values
+            self.iterations[pos] = iteration
+            self.iterations[pos + self.last] = iteration
+        self.nb_row += 1
+
+    def _rows(self) -> slice:
+        if self.last is None or self.nb_row <= self.last:
+            return slice(0, self.nb_row)
+        start = self.nb_row % self.last
+        return slice(start, start + self.last)
+
+    def get(self, start_iter=0) -> np.ndarray:
+        """View of the kept rows recorded at or after iteration start_iter"""
+        rows = self._rows()
+        skip = np.searchsorted(self.iterations[rows], start_iter)
+        return self.data[rows][skip:]
+
+    def get_iterations(self, start_iter=0) -> np.ndarray:
+        """Iteration of each row returned by get()"""
+        rows = self._rows()
+        skip = np.searchsorted(self.iterations[rows], start_iter)
+        return self.iterations[rows][skip:]
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Arrays to restore the recorder from with load_state, e.g. in a checkpoint"""
+        rows = slice(0, self.nb_row) if self.last is None else slice(None)
+        return {"nb_row": np.array(self.nb_row), "data": self.data[rows], "iterations": self.iterations[rows]}
+
+    def load_state(self, state : dict):
+        self.nb_row = int(state["nb_row"])
+        self.data = np.array(state["data"], dtype=float)
+        self.iterations = np.array(state["iterations"], dtype=np.int64)
+
+    def __len__(self):
+        return self._rows().stop - self._rows().start
@@ -0,0 +1,178 @@
+# Columnar store of per-iteration clock errors and bounds
+#
+# A result directory holds meta.json (the run parameters) and Parquet parts, one
+# per flushed chunk of iterations, with one row per (iteration, replica, node):
+#   iter, [replica,] node, error, bound
+# Parts are complete files as soon as they are written, so a killed run keeps what
+# it flushed and a resumed run (mode="append") adds new parts. pyarrow is only needed here.
+
+import os
+import glob
+import json
+import shutil
+
+import numpy as np
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("The result store needs pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+class ResultWriter:
+    """
+    Buffers the errors and bounds of recorded iterations and writes them out as a
+    compressed Parquet part every chunk_iters iterations.
+
+    Args:
+        path: result directory, parts are appended to the ones already there
+        nodes: ids of the recorded nodes
+        shape: shape of one recorded row, (nodes,) or (replicas, nodes)
+        meta: run parameters, written to meta.json with the shape of a row
+        chunk_iters: iterations per part
+        compression: Parquet codec
+        mode: what to do with a path that holds results already:
+            "new": refuse it (ValueError)
+            "append": add parts to them, the parameters must be the same (e.g. when
+                resuming the run from a checkpoint)
+            "overwrite": remove them
+    """
+
+    def __init__(self, path, nodes, shape, meta : dict, chunk_iters=1024, compression="zstd", mode="new"):
+        _arrow()
+        if mode not in ("new", "append", "overwrite"):
+            raise ValueError(f"Unknown mode {mode}, choose from new, append, overwrite")
+        self.path = path
+        self.nodes = np.asarray(nodes, dtype=np.int32)
+        self.shape = shape if isinstance(shape, tuple) else (shape,)
+        self.chunk_iters = chunk_iters
+        self.compression = compression
+        # Through JSON, to compare with the meta.json already there
+        meta = json.loads(json.dumps({**meta, "shape": self.shape}, default=str))
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.isdir(path) and os.listdir(path):
+            if mode == "new":
+                raise ValueError(f"{path} holds results already, use mode append or overwrite")
+            if mode == "overwrite":
+                shutil.rmtree(path)
+            elif os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    if json.load(f) != meta:
+                        raise ValueError(f"{path} holds results of a run with other parameters")
+        os.makedirs(path, exist_ok=True)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+        self.nb_part = len(glob.glob(os.path.join(path, "part-*.parquet")))
+
+        self.nb_buffered = 0
+        self.iterations = np.empty(chunk_iters, dtype=np.int64)
+        self.errors = np.empty((chunk_iters,) + self.shape)
+        self.bounds = np.empty((chunk_iters,) + self.shape)
+
+    def write(self, iteration, error : np.ndarray, bound : np.ndarray):
+        self.iterations[self.nb_buffered] = iteration
+        self.errors[self.nb_buffered] = error
+        self.bounds[self.nb_buffered] = bound
+        self.nb_buffered += 1
+        if self.nb_buffered == self.chunk_iters:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered iterations as a new part"""
+        if not self.nb_buffered:
+            return
+        pa = _arrow()
+        nb, width = self.nb_buffered, int(np.prod(self.shape))
+        columns = {"iter": np.repeat(self.iterations[:nb], width)}
+        if len(self.shape) == 2:
+            columns["replica"] = np.tile(np.repeat(np.arange(self.shape[0], dtype=np.int32), len(self.nodes)), nb)
+        columns["node"] = np.tile(self.nodes, nb * width // len(self.nodes))
+        columns["error"] = self.errors[:nb].ravel()
+        columns["bound"] = self.bounds[:nb].ravel()
+
+        part_path = os.path.join(self.path, f"part-{self.nb_part:05d}.parquet")
+        pa.parquet.write_table(pa.table(columns), part_path + ".tmp", compression=self.compression)
+        os.replace(part_path + ".tmp", part_path)
+        self.nb_part += 1
+        self.nb_buffered = 0
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Parts written so far. Flush first, so that they hold every recorded iteration."""
+        return {"nb_part": np.array(self.nb_part)}
+
+    def load_state(self, state : dict):
+        """Go back to the parts written when state was taken: later parts are removed, buffered iterations dropped"""
+        self.nb_part = int(state["nb_part"])
+        for part_path in glob.glob(os.path.join(self.path, "part-*.parquet")):
+            if int(os.path.basename(part_path)[len("part-"):-len(".parquet")]) >= self.nb_part:
+                os.remove(part_path)
+        self.nb_buffered = 0
+
+class Results:
+    """
+    A result directory, read lazily: only the requested columns, iterations and
+    nodes are loaded, from the parts that hold them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        pa = _arrow()
+        self.dataset = pa.dataset.dataset(sorted(glob.glob(os.path.join(path, "part-*.parquet"))), format="parquet")
+
+    @property
+    def columns(self) -> list[str]:
+        return self.dataset.schema.names
+
+    def read(self, columns=("error", "bound"), start_iter=0, end_iter=None, nodes=None) -> dict[str, np.ndarray]:
+        """
+        Columns of the iterations in [start_iter, end_iter), optionally of some nodes only.
+
+        Returns:
+            column -> array of shape (iterations, [replicas,] nodes), as Simulator.errors,
+            and "iter": the iteration of each row
+        Raises:
+            ValueError: the store does not hold every requested node exactly once per
+                iteration, e.g. when parts of different runs were mixed
+        """
+        pa = _arrow()
+        field = pa.dataset.field
+        condition = field("iter") >= start_iter
+        if end_iter is not None:
+            condition &= field("iter") < end_iter
+        if nodes is not None:
+            condition &= field("node").isin(np.asarray(nodes).tolist())
+        table = self.dataset.to_table(columns=["iter", "node"] + [c for c in columns if c not in ("iter", "node")],
+                                      filter=condition)
+
+        iters = table.column("iter").to_numpy()
+        if len(iters) and (np.diff(iters) < 0).any():
+            order = np.argsort(iters, kind="stable")
+        else:
+            order = None
+        row_iters, counts = np.unique(iters, return_counts=True)
+        row_shape = tuple(self.meta["shape"])
+        node_ids = np.unique(table.column("node").to_numpy())
+        if nodes is not None:
+            row_shape = row_shape[:-1] + (len(node_ids),)
+        elif len(iters) and len(node_ids) != row_shape[-1]:
+            raise ValueError(f"{self.path} holds {len(node_ids)} nodes, not the {row_shape[-1]} of meta.json")
+        if (counts != int(np.prod(row_shape))).any():
+            raise ValueError(f"{self.path} does not hold one row of shape {row_shape} per iteration: "
+                             f"iterations were written more than once or parts are missing")
+        shape = (len(row_iters),) + row_shape
+
+        data = {"iter": row_iters}
+        for column in columns:
+            if column == "iter":
+                continue
+            values = table.column(column).to_numpy()
+            if order is not None:
+                values = values[order]
+            data[column] = values.reshape(shape)
+        return data
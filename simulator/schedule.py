@@ -0,0 +1,264 @@
+# Compiled time-slice schedule
+
+import hashlib
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
+
+import utils
+from topo import SliceTopo
+
+class TopoSlice:
+    """
+    One compiled time slice. This is what the sync algorithms get as cur_topo.
+
+    Attributes:
+        slice_id: index of the slice in the schedule
+        csr: (nodes, indptr, indices), see utils.get_csr
+        graph: the networkx graph of the slice, failures applied. Built from csr on
+            first use when the slice was compiled without graphs.
+        distances: hop distances between all nodes once computed, see hop_distances
+    """
+    __slots__ = ("slice_id", "csr", "_graph", "distances", "restricted")
+
+    def __init__(self, slice_id, csr, graph=None, distances=None, restricted=False):
+        self.slice_id = slice_id
+        self.csr = csr
+        self._graph = graph
+        self.distances = distances
+        self.restricted = restricted
+
+    @property
+    def graph(self) -> nx.Graph:
+        if self._graph is None:
+            assert not self.restricted, "A restricted slice has no graph"
+            self._graph = utils.csr_to_graph(self.csr)
+        return self._graph
+
+    def nodes(self):
+        return self.csr[0]
+
+    def hop_distances(self) -> np.ndarray:
+        """Hop distances between all nodes (see utils.all_hop_distances), computed on first use"""
+        if self.distances is None:
+            self.distances = utils.all_hop_distances(self.csr)
+            self.distances.flags.writeable = False
+        return self.distances
+
+    def restrict(self, nodes : np.ndarray) -> "TopoSlice":
+        """
+        The slice with only the rows of the given nodes (ascending), so that only
+        they sync. Neighbors are kept as they are.
+        """
+        all_nodes, indptr, indices = self.csr
+        rows = np.searchsorted(all_nodes, nodes)
+        rows = rows[(rows < len(all_nodes)) & (all_nodes[np.minimum(rows, len(all_nodes) - 1)] == nodes)]
+        sub_indptr = np.zeros(len(rows) + 1, dtype=indptr.dtype)
+        np.cumsum(indptr[rows + 1] - indptr[rows], out=sub_indptr[1:])
+        return TopoSlice(self.slice_id, (all_nodes[rows], sub_indptr, indices[utils.segment_positions(indptr, rows)]),
+                         restricted=True)
+
+class Schedule:
+    """
+    Topology of every time slice compiled once into read-only index arrays.
+
+    The adjacency of all slices is stored back to back: slice k has row pointers
+    indptr[k] and neighbors indices[offsets[k]:offsets[k+1]]. Failed nodes and
+    links are removed at compile time, so looking up a slice is O(1).
+
+    With max_slices, slices are instead compiled when first looked up and only the
+    max_slices last used ones are kept, so that a huge lazy topology (e.g. from
+    topo.opera_lazy) is never held in full.
+    """
+
+    # Arrays of a compiled schedule, see from_arrays
+    arrays = ("nodes", "indptr", "offsets", "indices")
+
+    def __init__(self, topo : dict[int, nx.Graph], failed_node=[], failed_link=[], max_slices=None):
+        """
+        Args:
+            topo: topologies by time slice, as returned by topo.generate_topo, or a
+                topo.SliceTopo, compiled without building graphs
+            failed_node: ids of nodes removed from every slice
+            failed_link: edges removed from every slice
+            max_slices: compile slices on demand and keep at most this many
+        """
+        assert not (len(failed_node) and len(failed_link)), "Only one type of failure at a time"
+
+        self.topo = topo
+        self.failed_node = failed_node
+        self.failed_link = failed_link
+        self.removed_links = np.empty((0, 2), dtype=np.int64) # see remove_links
+        self.nb_slice = len(topo)
+        self.max_slices = max_slices
+        if max_slices is not None:
+            self.cache = OrderedDict()
+            self.nodes = self[0].csr[0]
+            return
+
+        graphs, csrs = zip(*[self.compile_slice(slice_id) for slice_id in range(self.nb_slice)])
+        self.compile(graphs, csrs)
+        self.topo = None # all compiled
+
+    @classmethod
+    def from_arrays(cls, nodes, indptr, offsets, indices) -> "Schedule":
+        """
+        A schedule compiled before, from its arrays (e.g. memory-mapped by
+        topo_cache.cached_schedule). Graphs are built from the CSR when needed.
+        """
+        schedule = cls.__new__(cls)
+        schedule.topo = None
+        schedule.failed_node, schedule.failed_link = [], []
+        schedule.removed_links = np.empty((0, 2), dtype=np.int64)
+        schedule.nb_slice = len(indptr)
+        schedule.max_slices = None
+        schedule.set_arrays(nodes, indptr, offsets, indices)
+        return schedule
+
+    def compile_slice(self, slice_id) -> tuple[nx.Graph, tuple]:
+        """Graph (None without one) and CSR of a slice, failures applied"""
+        topo, failed_node, failed_link = self.topo, self.failed_node, self.failed_link
+        if isinstance(topo, SliceTopo):
+            csr = topo.csr(slice_id)
+            # Same adjacency as graph.copy() and remove_*_from() on the slice graph
+            if len(failed_node):
+                csr = utils.csr_remove_nodes(utils.csr_copy(csr), failed_node)
+            elif len(failed_link):
+                csr = utils.csr_remove_edges(utils.csr_copy(csr), failed_link)
+            return None, csr
+
+        graph = topo[slice_id]
+        if len(failed_node):
+            graph = graph.copy()
+            graph.remove_nodes_from(failed_node)
+        elif len(failed_link):
+            graph = graph.copy()
+            graph.remove_edges_from(failed_link)
+        return graph, utils.get_csr(graph)
+
+    def compile(self, graphs, csrs, distances=None):
+        """Store the CSR of every slice back to back"""
+        nodes = csrs[0][0]
+        for slice_nodes, _, _ in csrs:
+            assert np.array_equal(slice_nodes, nodes), "All slices need the same nodes"
+        offsets = np.zeros(self.nb_slice + 1, dtype=np.int64)
+        np.cumsum([len(indices) for _, _, indices in csrs], out=offsets[1:])
+        # Row pointers of a slice stay small, int32 halves the largest array
+        assert max([indptr[-1] for _, indptr, _ in csrs]) < 2**31
+        indptr = np.stack([indptr for _, indptr, _ in csrs]).astype(np.int32)
+        indices = np.concatenate([indices for _, _, indices in csrs]).astype(np.int32)
+        self.set_arrays(nodes, indptr, offsets, indices, graphs, distances)
+
+    def set_arrays(self, nodes, indptr, offsets, indices, graphs=None, distances=None):
+        """Slices over the compiled arrays, which are made read-only"""
+        self.nodes, self.indptr, self.offsets, self.indices = nodes, indptr, offsets, indices
+        for arr in (self.nodes, self.indptr, self.offsets, self.indices):
+            arr.flags.writeable = False
+
+        if graphs is None:
+            graphs = [None] * self.nb_slice
+        if distances is None:
+            distances = [None] * self.nb_slice
+        self.slices = [
+            TopoSlice(slice_id, (self.nodes, self.indptr[slice_id],
+                                 self.indices[self.offsets[slice_id]:self.offsets[slice_id+1]]),
+                      graphs[slice_id], distances[slice_id])
+            for slice_id in range(self.nb_slice)
+        ]
+
+    def remove_links(self, links):
+        """
+        Fail links in every slice after compiling. Hop distances already computed are
+        updated in place of recomputed: only the sources with a shortest path that may
+        use a removed link (its ends are at different distances) run the BFS again.
+        Slices compiled on demand drop the links when they are compiled. The result is
+        the schedule compiled with the links in failed_link.
+
+        Args:
+            links: (u, v) pairs, links missing from a slice are ignored
+        """
+        links = np.asarray(links, dtype=np.int64).reshape(-1, 2)
+        if len(links) == 0:
+            return
+        if self.max_slices is not None:
+            self.removed_links = np.concatenate([self.removed_links, links])
+            self.cache.clear()
+            return
+        nb_id = int(max(self.nodes.max(initial=-1), links.max(initial=-1))) + 1
+        # Both directions of every link, encoded as u * nb_id + v
+        removed = np.concatenate([links[:, 0] * nb_id + links[:, 1], links[:, 1] * nb_id + links[:, 0]])
+
+        graphs, csrs, distances = [], [], []
+        for cur_slice in self.slices:
+            nodes, indptr, indices = cur_slice.csr
+            src = np.repeat(nodes, np.diff(indptr))
+            keep = ~np.isin(src * nb_id + indices, removed)
+
+            # Same adjacency, neighbor order included, as compiling with the links in
+            # failed_link (compile_slice): the slice is copied, then the links removed
+            graph = cur_slice._graph # left to be built from the CSR if it is not yet
+            if graph is not None:
+                graph = graph.copy()
+                graph.remove_edges_from(map(tuple, links.tolist()))
+                csr = utils.get_csr(graph)
+            else:
+                csr = utils.csr_remove_edges(utils.csr_copy(cur_slice.csr), links)
+
+            dist = cur_slice.distances
+            if dist is not None and not keep.all():
+                cut_src, cut_dst = src[~keep], indices[~keep]
+                affected = np.abs(dist[:, cut_src].astype(np.int32) - dist[:, cut_dst]) == 1
+                affected &= (dist[:, cut_src] >= 0) & (dist[:, cut_dst] >= 0)
+                sources = np.intersect1d(np.flatnonzero(affected.any(axis=1)), nodes)
+                dist = dist.copy()
+                dist[sources] = utils.hop_distances(csr, sources)
+                dist.flags.writeable = False
+
+            graphs.append(graph)
+            csrs.append(csr)
+            distances.append(dist)
+        self.compile(graphs, csrs, distances)
+
+    def fingerprint(self) -> str:
+        """
+        Content hash of the compiled arrays, to tell whether a schedule is the one a
+        checkpoint was taken on. Lazy schedules only hash their nodes, slice count and
+        failed links.
+        """
+        if self.max_slices is None:
+            parts = [getattr(self, name) for name in self.arrays]
+        else:
+            failed_link = np.asarray(self.failed_link, dtype=np.int64).reshape(-1, 2)
+            parts = [self.nodes, np.array([self.nb_slice]), np.concatenate([failed_link, self.removed_links])]
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(np.ascontiguousarray(part, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def __len__(self):
+        return self.nb_slice
+
+    def __getitem__(self, slice_id) -> TopoSlice:
+        if self.max_slices is None:
+            return self.slices[slice_id]
+
+        cur_slice = self.cache.get(slice_id)
+        if cur_slice is not None:
+            self.cache.move_to_end(slice_id)
+            return cur_slice
+        graph, csr = self.compile_slice(slice_id)
+        if len(self.removed_links):
+            graph, csr = None, utils.csr_remove_edges(utils.csr_copy(csr), self.removed_links)
+        nodes, indptr, indices = csr
+        cur_slice = TopoSlice(slice_id, (nodes, indptr.astype(np.int32), indices.astype(np.int32)), graph)
+        self.cache[slice_id] = cur_slice
+        if len(self.cache) > self.max_slices:
+            self.cache.popitem(last=False)
+        return cur_slice
+
+    def get_slice_id(self, cur_time_ns, slice_duration_ns) -> int:
+        return (cur_time_ns // slice_duration_ns) % self.nb_slice
+
+    def get_cur_topo(self, cur_time_ns, slice_duration_ns) -> TopoSlice:
+        return self[self.get_slice_id(cur_time_ns, slice_duration_ns)]
@@ -1,10 +1,16 @@
-import copy
+import os
+import json
 
 import numpy as np
 #from numba import jit
 
-import topo, para
+import topo, para, algo
 import utils
+import topo_cache
+from schedule import Schedule
+from recorder import Recorder
+from stats import ErrorStats, PathLengthCounter, sub_state
+from results import ResultWriter
 
 class Simulator:
 
@@ -25,29 +31,85 @@ class Simulator:
             slice_duration_ns = 1,
             offset_drift = True,
             failed_node = [],
-            failed_link = []
+            failed_link = [],
+            record_stride = 1,
+            record_last = None,
+            record_stats_only = False,
+            collect_stats = False,
+            stats_start_iter = 0,
+            seed = 42,
+            replicas = None,
+            backend = "numpy",
+            noise_block_size = None,
+            noise_distributions = None,
+            max_compiled_slices = None,
+            topo_cache_dir = None,
+            record_provenance = False,
+            detect_convergence = False,
+            result_dir = None,
+            result_chunk_iters = 1024,
+            result_mode = "new"
     ):
+        """
+        Args:
+            seed: seed of the random generator, an int or a np.random.SeedSequence
+            replicas: run this many Monte-Carlo replicas at once over the same topology.
+                Each replica has its own drifts and noise, and errors and bounds
+                get a leading replica axis: (replicas, nb_node).
+            backend: implementation of sync_algo, "numpy", "numba" or "python" (see algo.backends)
+            noise_block_size: draw the noise from a para.NoiseProvider that pre-generates
+                blocks of this many draws per component. By default noise is drawn from
+                the generator when needed.
+            noise_distributions: component ("hop_error", "path_asymmetry", "drift_variance")
+                -> noise model, a name in para.noise_models or a function(rng, size) of unit
+                draws. Implies the NoiseProvider.
+            max_compiled_slices: compile time slices on demand and keep at most this many
+                (see Schedule), for huge topologies such as topo.opera_lazy
+            topo_cache_dir: keep generated topologies and compiled schedules in this
+                directory, keyed by generator, parameters and random state, and map them
+                from there when a run uses the same ones again (see topo_cache)
+            record_stride: record errors and bounds every record_stride iterations
+            record_last: only keep the last record_last recorded iterations
+            record_stats_only: keep running statistics instead of the recorded iterations
+            collect_stats: keep running statistics (tail percentiles, CDF, per-node max/mean)
+                of clock errors and bounds in error_stats and bound_stats
+            stats_start_iter: first iteration counted into the statistics
+            record_provenance: log the source and path length of every sync in
+                path_length_counter (see stats.PathLengthCounter.provenance)
+            detect_convergence: watch for the bounds to repeat with the schedule in
+                convergence (see utils.ConvergenceDetector), as run(stop_on_convergence=True) does
+            result_dir: also stream the recorded errors and bounds, with the run parameters,
+                to Parquet parts in this directory (see results), every result_chunk_iters
+                recorded iterations and at the end of every run. result_mode says what to do
+                with results already there (see results.ResultWriter): refuse them ("new"),
+                add to them ("append", e.g. to resume from a checkpoint) or remove them ("overwrite")
+        """
         
-        self.rng = np.random.default_rng(seed=42)  # set the seed
+        self.rng = np.random.default_rng(seed=seed)  # set the seed
+        if noise_block_size is not None or noise_distributions is not None:
+            self.rng = para.NoiseProvider(self.rng, noise_block_size or 1 << 16, noise_distributions)
 
         self.name = name
-        self.sync_algo = sync_algo
+        self.sync_algo = algo.get_backend(sync_algo, backend)
         self.nb_node = nb_node
         self.nb_link = nb_link
+        self.topo_func = topo_func
+        self.topo_cache_dir = topo_cache_dir
+        self.topo_rng_state = None # generator state the current topology was changed from, see run
         if topo_arg is not None:
             self.first_topo, self.second_topo = topo_arg
-            self.topo = topo.generate_topo(nb_node, topo_func(rng=self.rng, nb_node=nb_node, nb_link=nb_link, skew_ratio=self.first_topo))
+            self.topo = self.generate_topo(skew_ratio=self.first_topo)
         else:
-            self.topo = topo.generate_topo(nb_node, topo_func(rng=self.rng, nb_node=nb_node, nb_link=nb_link))
+            self.topo = self.generate_topo()
         
         #topo.compute_skewness(self.topo)
 
-        self.topo_func = topo_func
-        self.drift_rate = para.gen_drift(self.rng, nb_node, drift_bound)
+        self.replicas = replicas
+        self.drift_rate = para.gen_drift(self.rng, nb_node, drift_bound, replicas)
         if self.name == "ptp":
-            self.drift_variance_bound = para.gen_drift_variance_tree(self.rng, nb_node, drift_variance_bound)
+            self.drift_variance_bound = para.gen_drift_variance_tree(self.rng, nb_node, drift_variance_bound, replicas)
         else:
-            self.drift_variance_bound = para.gen_drift_variance(self.rng, nb_node, drift_variance_bound)
+            self.drift_variance_bound = para.gen_drift_variance(self.rng, nb_node, drift_variance_bound, replicas)
         self.sync_interval_ns = sync_interval_ns
         self.slice_duration_ns = slice_duration_ns
         if hop_error_bound is None:
@@ -57,125 +119,358 @@ class Simulator:
         self.hop_error_d = hop_error_d
         self.offset_drift = offset_drift
 
-        self.nodes = self.topo[0].nodes()
+        self.nodes = self.topo.nodes.tolist()
         self.cur_error = np.array([0] + [1e3] * (nb_node-1)) # current clock error of nodes 
         self.cur_bound = np.array([0] + [1e3] * (nb_node-1))  # current clock error bound of nodes 
-        self.path_length_counter = {node: 0 for node in self.nodes}
-        self.path_length_tracker = {node: 0 for node in self.nodes}
+        self.path_length_counter = PathLengthCounter(nb_node, record_provenance) # syncs by path length
+        self.path_length_tracker = np.zeros(nb_node, dtype=int) # hops from node 0 of each node's last sync
+        if replicas is not None:
+            self.cur_error = np.tile(self.cur_error, (replicas, 1))
+            self.cur_bound = np.tile(self.cur_bound, (replicas, 1))
+            self.path_length_tracker = np.tile(self.path_length_tracker, (replicas, 1))
         #self.cur_error = np.array([0] * (nb_node)) # current clock error of nodes 
         #self.cur_bound = np.array([0] * (nb_node))  # current clock error bound of nodes 
-        self.errors = []
-        self.bounds = []
         self.failed_node = failed_node # ids of failed nodes
         self.failed_link = []
+        self.added_failed_link = [] # links failed by fail_links, for checkpoints
         self.topo_update_ts = topo_update_ts
 
         if failed_link: # Generate topology for the given number of failed links
             nb_ts = len(self.topo.keys())
-            for ts, cur_topo in self.topo.items():
-                edges_to_be_removed = self.rng.choice(cur_topo.edges(), size=int(failed_link/nb_ts))
+            for ts in self.topo.keys():
+                edges_to_be_removed = self.rng.choice(self.topo.graph_edges(ts), size=int(failed_link/nb_ts))
                 #print(f"{list(cur_topo.edges())=}")
                 #print(f"{edges_to_be_removed=}")
                 self.failed_link.extend(edges_to_be_removed)
+            print(f"{self.failed_link=}")
+
+        self.max_compiled_slices = max_compiled_slices
+        self.schedule = self.compile_schedule()
+
+        # don't add failed node error into account
+        self.counted_node = np.delete(np.arange(nb_node), self.failed_node) if self.failed_node else None
+        nb_counted = para.node_shape(nb_node - len(self.failed_node), replicas)
+        self.nb_iter = 0 # iterations run so far
+        self.cur_time_ns = 0 # simulated time so far
+        self.run_end_iter = 0 # iteration the last run goes to, for resuming it
+        self.record_stats_only = record_stats_only
+        self.record_stride = record_stride
+        self.collect_stats = collect_stats or record_stats_only
+        self.stats_start_iter = stats_start_iter
+        if self.collect_stats:
+            self.error_stats = ErrorStats(nb_counted)
+            self.bound_stats = ErrorStats(nb_counted)
+        if not record_stats_only:
+            self.error_record = Recorder(nb_counted, stride=record_stride, last=record_last)
+            self.bound_record = Recorder(nb_counted, stride=record_stride, last=record_last)
+        self.convergence = utils.ConvergenceDetector() if detect_convergence else None
 
+        self.result_writer = None
+        if result_dir is not None:
+            counted = np.arange(nb_node) if self.counted_node is None else self.counted_node
+            self.result_writer = ResultWriter(result_dir, counted, nb_counted, {
+                "name": name,
+                "algorithm": self.sync_algo.__name__,
+                "backend": backend,
+                "topo": topo_func.__name__,
+                "nb_node": nb_node,
+                "nb_link": nb_link,
+                "sync_interval_ns": sync_interval_ns,
+                "slice_duration_ns": slice_duration_ns,
+                "drift_bound": drift_bound,
+                "drift_variance_bound": drift_variance_bound,
+                "hop_error_bound": self.hop_error_bound,
+                "offset_drift": offset_drift,
+                "failed_node": list(failed_node),
+                "failed_link": failed_link,
+                "replicas": replicas,
+                "seed": seed if isinstance(seed, (int, type(None))) else
+                        {"entropy": seed.entropy, "spawn_key": list(seed.spawn_key)},
+                "record_stride": record_stride,
+            }, chunk_iters=result_chunk_iters, mode=result_mode)
         
     def __str__(self):
         return f"{self.name} {self.sync_algo.__name__} {self.topo[0].number_of_nodes()} {self.topo[0].number_of_edges()}" \
         f" {self.drift_rate[:5]} {self.drift_variance_bound[:5]} {self.sync_interval_ns} {self.slice_duration_ns}"
+    def generate_topo(self, **topo_params) -> topo.SliceTopo:
+        """Topology of topo_func, from the topology cache when there is one"""
+        if self.topo_cache_dir is None:
+            return topo.generate_compact_topo(self.nb_node, self.topo_func(
+                rng=self.rng, nb_node=self.nb_node, nb_link=self.nb_link, **topo_params))
+        return topo_cache.cached_topo(self.topo_cache_dir, self.topo_func, self.rng,
+                                      nb_node=self.nb_node, nb_link=self.nb_link, **topo_params)
+
+    def compile_schedule(self) -> Schedule:
+        # Failures are the same in every slice, so apply them once
+        if self.topo_cache_dir is None or self.max_compiled_slices is not None:
+            return Schedule(self.topo, self.failed_node, self.failed_link, self.max_compiled_slices)
+        return topo_cache.cached_schedule(self.topo_cache_dir, self.topo, self.failed_node, self.failed_link)
+
+    def fail_links(self, links):
+        """
+        Fail links from now on, in every slice. The compiled schedule is updated in
+        place of recompiled (see Schedule.remove_links), schedules compiled later
+        (on a topology change) have the links in failed_link.
+
+        Args:
+            links: (u, v) pairs
+        """
+        if self.failed_node:
+            raise ValueError("Only one type of failure at a time")
+        links = np.asarray(links, dtype=np.int64).reshape(-1, 2)
+        self.schedule.remove_links(links)
+        self.failed_link.extend(map(tuple, links.tolist()))
+        self.added_failed_link.extend(links.tolist())
+
     def get_runtime_drift_variance(self):
         return para.get_runtime_drift_variance(self.rng, self.drift_variance_bound)
     #@jit(forceobj=True, looplift=True)
-    def run(self, iter):
-        """Run simulator for a period of time
+    def run(self, iter, stop_on_convergence=False, checkpoint_path=None, checkpoint_every=None, resume=False):
+        """Run simulator for a period of time, continuing from where the last run stopped
 
         Args:
-            iter: Sync iterations"""
+            iter: Sync iterations
+            stop_on_convergence: stop as soon as the bounds repeat at the same position
+                in the schedule, i.e. reached their periodic steady state
+            checkpoint_path: save a checkpoint (see save_checkpoint) here at the end of the run
+            checkpoint_every: also save it every checkpoint_every iterations
+            resume: if checkpoint_path exists, load it and run the rest of the run it was
+                saved from instead (iter is ignored). Resuming a finished run does nothing.
+                With a result_dir, build the simulator with result_mode="append" to resume."""
+        if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self.load_checkpoint(checkpoint_path)
+            iter = self.run_end_iter - self.nb_iter
+            print(f"{self.name} resumed at iter {self.nb_iter}, {iter} to go")
+        self.run_end_iter = self.nb_iter + iter
+        if stop_on_convergence and self.convergence is None:
+            self.convergence = utils.ConvergenceDetector()
+        schedule_period_ns = self.slice_duration_ns * len(self.schedule)
 
-        cur_time_ns = 0
-        while cur_time_ns < iter * self.sync_interval_ns:
+        if not self.record_stats_only:
+            self.error_record.reserve(iter, start_iter=self.nb_iter)
+            self.bound_record.reserve(iter, start_iter=self.nb_iter)
+
+        sync_count = 0
+        end_time_ns = self.cur_time_ns + iter * self.sync_interval_ns
+        while self.cur_time_ns < end_time_ns:
             # for exp of changing topology during operation
-            if self.topo_update_ts is not None and (cur_time_ns // self.sync_interval_ns == self.topo_update_ts):
+            if self.topo_update_ts is not None and (self.cur_time_ns // self.sync_interval_ns == self.topo_update_ts):
                 print(f"change topo at ts {self.topo_update_ts}")
-                self.topo = topo.generate_topo(self.nb_node, self.topo_func(self.rng, self.nb_node, self.nb_link, self.second_topo))
-
-            cur_topo = utils.get_cur_topo(
-                        cur_time_ns, 
-                        slice_duration_ns=self.slice_duration_ns, 
-                        topo=self.topo
-                        )
-            
-            if self.failed_node:
-                assert len(self.failed_link) == 0, "Only one type of failure at a time"
-                assert len(cur_topo.nodes()) == self.nb_node, "Original topo has been modified"
-                cur_topo = cur_topo.copy()
-                cur_topo.remove_nodes_from(self.failed_node)
-
-            elif self.failed_link:
-                print(f"{self.failed_link=}")
-                cur_topo = cur_topo.copy()
-                cur_topo.remove_edges_from(self.failed_link)
+                self.topo_rng_state = topo_cache.get_rng_state(self.rng)
+                self.topo = self.generate_topo(skew_ratio=self.second_topo)
+                self.schedule = self.compile_schedule()
+                schedule_period_ns = self.slice_duration_ns * len(self.schedule)
+                if self.convergence is not None:
+                    self.convergence.reset()
+
+            cur_topo = self.schedule.get_cur_topo(self.cur_time_ns, slice_duration_ns=self.slice_duration_ns)
 
             # Sync. Update errors and bounds
-            if self.name == "syncwise" or self.name == "ptp" :
-                self.cur_error, self.cur_bound, sync_count = \
-                    self.sync_algo(
-                        rng = self.rng, 
-                        cur_error = self.cur_error, 
-                        cur_bound = self.cur_bound, 
-                        cur_topo = cur_topo,
-                        hop_error_bound = self.hop_error_bound,
-                        #hop_error_d = self.hop_error_d,
-                        path_length_tracker = self.path_length_tracker,
-                        path_length_counter = self.path_length_counter
-                    )
-            else:
-                self.cur_error, self.cur_bound, sync_count = \
-                    self.sync_algo(
-                        rng = self.rng, 
-                        cur_error = self.cur_error, 
-                        cur_bound = self.cur_bound, 
-                        cur_topo = cur_topo,
-                        hop_error_bound = self.hop_error_bound,
-                    )
-
-            if self.offset_drift:
-                #print(f"drift variance increase {self.get_runtime_drift_variance()[:20] * self.sync_interval_ns / 1e6}")
-                self.cur_error = self.cur_error + self.get_runtime_drift_variance() * self.sync_interval_ns / 1e6
-                self.cur_bound = self.cur_bound + self.drift_variance_bound * self.sync_interval_ns / 1e6
-                if self.name != "firefly" and self.name != "dtp": # firefly and dtp use internal error
-                    self.cur_error[0] = 0
-                    self.cur_bound[0] = 0
-            else:
-                self.cur_error = self.cur_error + (self.drift_rate + self.get_runtime_drift_variance()) * self.sync_interval_ns / 1e6
-                self.cur_bound = self.cur_bound + (self.drift_rate + self.drift_variance_bound) * self.sync_interval_ns / 1e6
-                if self.name != "firefly" and self.name != "dtp": # firefly use internal error
-                    self.cur_error[0] = 0
-                    self.cur_bound[0] = 0
-                
+            sync_count = self.sync(cur_topo)
+
+            self.drift(self.sync_interval_ns, self.get_runtime_drift_variance())
+
             # Record error
-            if self.failed_node:
-                # don't add failed node error into account
-                counted_err = np.delete(copy.deepcopy(self.cur_error), self.failed_node)
-                counted_bound = np.delete(copy.deepcopy(self.cur_bound), self.failed_node)
-                self.errors.append(counted_err)
-                self.bounds.append(counted_bound)
-            else:
-                self.errors.append(copy.deepcopy(self.cur_error))
-                self.bounds.append(copy.deepcopy(self.cur_bound))
-            
+            self.record()
 
             # Time procede
-            cur_time_ns += self.sync_interval_ns
+            self.cur_time_ns += self.sync_interval_ns
+            self.nb_iter += 1
+
+            if self.convergence is not None:
+                self.convergence.update(self.cur_bound, self.cur_time_ns % schedule_period_ns)
+                if stop_on_convergence and self.convergence.converged:
+                    print(f"{self.name} converged at iter {self.nb_iter}, period {self.convergence.period}")
+                    self.run_end_iter = self.nb_iter
+                    break
+            if checkpoint_every and self.nb_iter % checkpoint_every == 0 and self.nb_iter < self.run_end_iter:
+                self.save_checkpoint(checkpoint_path)
         #print(f"{self.path_length_counter=}")
+        if self.result_writer is not None:
+            self.result_writer.flush()
+        if checkpoint_path is not None:
+            self.save_checkpoint(checkpoint_path)
         print(f"{self.name} sync ctr: {sync_count}")
-    
-    def get_clock_errors(self, start_record_from=0) -> list:       
+
+    def state(self) -> tuple[dict[str, np.ndarray], dict]:
+        """
+        Everything a run continues from: clocks, random state (with the noise not handed
+        out yet), recorded iterations and statistics, path length counts, time and
+        iteration counters. The schedule is identified by its fingerprint, a topology
+        changed during the run by the generator state it was generated from.
+
+        The convergence detector is not kept, it starts over after a restore.
+
+        Returns:
+            arrays, JSON-serializable metadata
+        """
+        arrays = {name: getattr(self, name) for name in
+                  ("cur_error", "cur_bound", "path_length_tracker", "drift_rate", "drift_variance_bound")}
+        parts = {"path_length_counter": self.path_length_counter}
+        if self.collect_stats:
+            parts.update(error_stats=self.error_stats, bound_stats=self.bound_stats)
+        if not self.record_stats_only:
+            parts.update(error_record=self.error_record, bound_record=self.bound_record)
+        if isinstance(self.rng, para.NoiseProvider):
+            parts["noise"] = self.rng
+        if self.result_writer is not None:
+            parts["result_writer"] = self.result_writer
+        for prefix, part in parts.items():
+            arrays.update({f"{prefix}.{key}": value for key, value in part.state().items()})
+
+        meta = {
+            "name": self.name,
+            "nb_node": self.nb_node,
+            "replicas": self.replicas,
+            "nb_iter": int(self.nb_iter),
+            "cur_time_ns": int(self.cur_time_ns),
+            "run_end_iter": int(self.run_end_iter),
+            "rng_state": topo_cache.get_rng_state(self.rng),
+            "topo_rng_state": self.topo_rng_state,
+            "topo_cache_key": getattr(self.topo, "cache_key", None),
+            "schedule": self.schedule.fingerprint(),
+            "added_failed_link": self.added_failed_link,
+        }
+        return arrays, meta
+
+    def load_state(self, arrays : dict, meta : dict):
+        """Restore a state of a simulator built with the same arguments, see state"""
+        if (meta["name"], meta["nb_node"], meta["replicas"]) != (self.name, self.nb_node, self.replicas):
+            raise ValueError(f"State of a different simulator: {meta['name']} with {meta['nb_node']} nodes")
+        if meta["topo_rng_state"] is not None and meta["topo_rng_state"] != self.topo_rng_state:
+            # The topology changed during the run, generate the same one again
+            self.topo_rng_state = meta["topo_rng_state"]
+            topo_cache.set_rng_state(self.rng, self.topo_rng_state)
+            self.topo = self.generate_topo(skew_ratio=self.second_topo)
+            self.schedule = self.compile_schedule()
+        # Links failed by fail_links since the simulator was built
+        added = meta.get("added_failed_link", [])
+        if added[:len(self.added_failed_link)] == self.added_failed_link and len(added) > len(self.added_failed_link):
+            self.fail_links(added[len(self.added_failed_link):])
+        if self.schedule.fingerprint() != meta["schedule"]:
+            raise ValueError("State of a run on a different schedule")
+
+        for name in ("cur_error", "cur_bound", "path_length_tracker", "drift_rate", "drift_variance_bound"):
+            setattr(self, name, np.array(arrays[name]))
+        self.path_length_counter.load_state(sub_state(arrays, "path_length_counter."))
+        if self.collect_stats:
+            self.error_stats.load_state(sub_state(arrays, "error_stats."))
+            self.bound_stats.load_state(sub_state(arrays, "bound_stats."))
+        if not self.record_stats_only:
+            self.error_record.load_state(sub_state(arrays, "error_record."))
+            self.bound_record.load_state(sub_state(arrays, "bound_record."))
+        if isinstance(self.rng, para.NoiseProvider):
+            self.rng.load_state(sub_state(arrays, "noise."))
+        if self.result_writer is not None:
+            self.result_writer.load_state(sub_state(arrays, "result_writer."))
+        if self.convergence is not None:
+            self.convergence.reset()
+
+        topo_cache.set_rng_state(self.rng, meta["rng_state"])
+        self.nb_iter = meta["nb_iter"]
+        self.cur_time_ns = meta["cur_time_ns"]
+        self.run_end_iter = meta["run_end_iter"]
+
+    def save_checkpoint(self, path):
+        """
+        Save the state of the simulator (see state) to path, an .npz file. The file is
+        replaced atomically, so a run killed while saving keeps the previous checkpoint.
+        """
+        if self.result_writer is not None:
+            self.result_writer.flush()
+        arrays, meta = self.state()
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+
+    def load_checkpoint(self, path):
+        """Continue from a checkpoint of a simulator built with the same arguments"""
+        with np.load(path) as checkpoint:
+            meta = json.loads(str(checkpoint["meta"]))
+            arrays = {name: checkpoint[name] for name in checkpoint.files if name != "meta"}
+        self.load_state(arrays, meta)
+
+    def sync(self, cur_topo) -> int:
+        """Run one round of the sync algorithm over cur_topo"""
+        if self.name == "syncwise" or self.name == "ptp" :
+            self.path_length_counter.cur_iter = self.nb_iter
+            self.cur_error, self.cur_bound, sync_count = \
+                self.sync_algo(
+                    rng = self.rng, 
+                    cur_error = self.cur_error, 
+                    cur_bound = self.cur_bound, 
+                    cur_topo = cur_topo,
+                    hop_error_bound = self.hop_error_bound,
+                    #hop_error_d = self.hop_error_d,
+                    path_length_tracker = self.path_length_tracker,
+                    path_length_counter = self.path_length_counter
+                )
+        else:
+            self.cur_error, self.cur_bound, sync_count = \
+                self.sync_algo(
+                    rng = self.rng, 
+                    cur_error = self.cur_error, 
+                    cur_bound = self.cur_bound, 
+                    cur_topo = cur_topo,
+                    hop_error_bound = self.hop_error_bound,
+                )
+        return sync_count
+
+    def drift(self, duration_ns, runtime_drift_variance):
+        """Let clocks drift for duration_ns"""
+        if self.offset_drift:
+            #print(f"drift variance increase {self.get_runtime_drift_variance()[:20] * self.sync_interval_ns / 1e6}")
+            self.cur_error = self.cur_error + runtime_drift_variance * duration_ns / 1e6
+            self.cur_bound = self.cur_bound + self.drift_variance_bound * duration_ns / 1e6
+            if self.name != "firefly" and self.name != "dtp": # firefly and dtp use internal error
+                self.cur_error[..., 0] = 0
+                self.cur_bound[..., 0] = 0
+        else:
+            self.cur_error = self.cur_error + (self.drift_rate + runtime_drift_variance) * duration_ns / 1e6
+            self.cur_bound = self.cur_bound + (self.drift_rate + self.drift_variance_bound) * duration_ns / 1e6
+            if self.name != "firefly" and self.name != "dtp": # firefly use internal error
+                self.cur_error[..., 0] = 0
+                self.cur_bound[..., 0] = 0
+
+
+    def record(self):
+        cur_error, cur_bound = self.cur_error, self.cur_bound
+        if self.counted_node is not None:
+            cur_error, cur_bound = cur_error[..., self.counted_node], cur_bound[..., self.counted_node]
+        if self.collect_stats and self.nb_iter >= self.stats_start_iter:
+            if self.name == 'firefly':
+                self.error_stats.update(np.abs(cur_error - np.average(cur_error, axis=-1, keepdims=True)))
+            else:
+                self.error_stats.update(np.abs(cur_error))
+            self.bound_stats.update(cur_bound)
+        if not self.record_stats_only:
+            self.error_record.record(self.nb_iter, cur_error)
+            self.bound_record.record(self.nb_iter, cur_bound)
+        if self.result_writer is not None and self.nb_iter % self.record_stride == 0:
+            self.result_writer.write(self.nb_iter, cur_error, cur_bound)
+
+    @property
+    def errors(self) -> np.ndarray:
+        """Recorded clock errors, one row (of shape (replicas, nb_node) with replicas) per recorded iteration (a view)"""
+        assert not self.record_stats_only, "Only running statistics are kept"
+        return self.error_record.get()
+
+    @property
+    def bounds(self) -> np.ndarray:
+        """Recorded error bounds, one row per recorded iteration (a view)"""
+        assert not self.record_stats_only, "Only running statistics are kept"
+        return self.bound_record.get()
+
+    def get_clock_errors(self, start_record_from=0) -> np.ndarray:
+        """Absolute clock errors recorded from iteration start_record_from on"""
         if self.name == 'firefly':
             return self.get_internal_clock_errors(start_record_from) 
-        return np.abs(self.errors[start_record_from:])
+        return np.abs(self.error_record.get(start_record_from))
     
-    def get_internal_clock_errors(self, start_record_from=0) -> list:
-        internal_err = [errs - np.average(errs) for errs in self.errors[start_record_from:]]
-        return np.abs(internal_err)
-    def get_error_bound(self, start_record_from=0) -> list:
-        return self.bounds[start_record_from:]
\ No newline at end of file
+    def get_internal_clock_errors(self, start_record_from=0) -> np.ndarray:
+        errors = self.error_record.get(start_record_from)
+        return np.abs(errors - np.average(errors, axis=-1, keepdims=True))
+
+    def get_error_bound(self, start_record_from=0) -> np.ndarray:
+        """View of the error bounds recorded from iteration start_record_from on"""
+        return self.bound_record.get(start_record_from)
\ No newline at end of file
@@ -0,0 +1,269 @@
+# Statistics of node values collected while the simulator runs
+
+import numpy as np
+
+class RunningStats:
+    """
+    Per-node running mean and max, without keeping the samples.
+
+    Args:
+        width: number of nodes, or the shape of the values (e.g. (replicas, nb_node))
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self.count = 0
+        self.sum = np.zeros(width)
+        self.max = np.full(width, -np.inf)
+
+    def update(self, values : np.ndarray):
+        self.count += 1
+        self.sum += values
+        np.maximum(self.max, values, out=self.max)
+
+    def mean(self) -> np.ndarray:
+        return self.sum / max(self.count, 1)
+
+    def merge(self, other : "RunningStats"):
+        assert self.width == other.width
+        self.count += other.count
+        self.sum += other.sum
+        np.maximum(self.max, other.max, out=self.max)
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Arrays to restore the statistics from with load_state, e.g. in a checkpoint"""
+        return {"count": np.array(self.count), "sum": self.sum, "max": self.max}
+
+    def load_state(self, state : dict):
+        self.count = int(state["count"])
+        self.sum = np.array(state["sum"], dtype=float)
+        self.max = np.array(state["max"], dtype=float)
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch of non-negative values with relative accuracy
+    (log-spaced buckets, as in DDSketch). Any quantile is returned within
+    relative_accuracy of an actual sample, using memory logarithmic in the value range.
+    """
+
+    def __init__(self, relative_accuracy=1e-3, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.min_value = min_value # values below count as zero
+        self.zero_count = 0
+        self.offset = 0 # bucket id of counts[0]
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + int(self.counts.sum())
+
+    def _add_buckets(self, bucket_ids : np.ndarray, counts : np.ndarray):
+        if len(bucket_ids) == 0:
+            return
+        low, high = bucket_ids.min(), bucket_ids.max() + 1
+        if len(self.counts):
+            low, high = min(low, self.offset), max(high, self.offset + len(self.counts))
+        if low < self.offset or high > self.offset + len(self.counts):
+            grown = np.zeros(high - low, dtype=np.int64)
+            grown[self.offset - low:self.offset - low + len(self.counts)] = self.counts
+            self.counts, self.offset = grown, low
+        np.add.at(self.counts, bucket_ids - self.offset, counts)
+
+    def update(self, values : np.ndarray):
+        values = np.ravel(values)
+        positive = values[values >= self.min_value]
+        self.zero_count += len(values) - len(positive)
+        if len(positive) == 0:
+            return
+        bucket_ids = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+        low = bucket_ids.min()
+        counts = np.bincount(bucket_ids - low)
+        nonzero = np.flatnonzero(counts)
+        self._add_buckets(nonzero + low, counts[nonzero])
+
+    def merge(self, other : "QuantileSketch"):
+        assert self.gamma == other.gamma, "Sketches need the same accuracy"
+        self.zero_count += other.zero_count
+        nonzero = np.flatnonzero(other.counts)
+        self._add_buckets(nonzero + other.offset, other.counts[nonzero])
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"zero_count": np.array(self.zero_count), "offset": np.array(self.offset), "counts": self.counts}
+
+    def load_state(self, state : dict):
+        self.zero_count = int(state["zero_count"])
+        self.offset = int(state["offset"])
+        self.counts = np.array(state["counts"], dtype=np.int64)
+
+    def _bucket_value(self, bucket_ids):
+        return 2 * self.gamma ** bucket_ids / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Value at quantile q in [0, 1], q may be an array"""
+        q = np.asarray(q, dtype=float)
+        total = self.count
+        assert total > 0, "Empty sketch"
+        rank = q * (total - 1)
+        cumsum = self.zero_count + np.cumsum(self.counts)
+        bucket = np.searchsorted(cumsum, rank, side='right')
+        value = self._bucket_value(self.offset + np.minimum(bucket, len(self.counts) - 1))
+        return np.where(rank < self.zero_count, 0.0, value)
+
+    def cdf(self) -> tuple[np.ndarray, np.ndarray]:
+        """Bucket values and the fraction of samples at or below each"""
+        nonzero = np.flatnonzero(self.counts)
+        x = np.concatenate(([0.0], self._bucket_value(self.offset + nonzero)))
+        y = np.cumsum(np.concatenate(([self.zero_count], self.counts[nonzero]))) / self.count
+        return x, y
+
+class Histogram:
+    """Fixed-bin histogram over [0, max_value), values beyond counted as overflow"""
+
+    def __init__(self, max_value=1000, nb_bin=10000):
+        self.edges = np.linspace(0, max_value, nb_bin + 1)
+        self.bin_width = max_value / nb_bin
+        self.counts = np.zeros(nb_bin, dtype=np.int64)
+        self.overflow = 0
+
+    def update(self, values : np.ndarray):
+        bins = (np.ravel(values) / self.bin_width).astype(np.int64)
+        inside = bins < len(self.counts)
+        self.overflow += len(bins) - np.count_nonzero(inside)
+        self.counts += np.bincount(np.maximum(bins[inside], 0), minlength=len(self.counts))
+
+    def merge(self, other : "Histogram"):
+        assert np.array_equal(self.edges, other.edges), "Histograms need the same bins"
+        self.counts += other.counts
+        self.overflow += other.overflow
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"counts": self.counts, "overflow": np.array(self.overflow)}
+
+    def load_state(self, state : dict):
+        self.counts = np.array(state["counts"], dtype=np.int64)
+        self.overflow = int(state["overflow"])
+
+    def cdf(self) -> tuple[np.ndarray, np.ndarray]:
+        """Upper bin edges and the fraction of samples below each"""
+        return self.edges[1:], np.cumsum(self.counts) / max(self.counts.sum() + self.overflow, 1)
+
+class ErrorStats(RunningStats):
+    """
+    Running statistics of non-negative node values (clock errors or bounds):
+    per-node mean and max, a quantile sketch for the tail and a histogram for CDFs.
+    Stats of different runs can be merged.
+    """
+
+    def __init__(self, width, relative_accuracy=1e-3, hist_max=1000, hist_bins=10000):
+        super().__init__(width)
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.histogram = Histogram(hist_max, hist_bins)
+
+    def update(self, values : np.ndarray):
+        super().update(values)
+        self.sketch.update(values)
+        self.histogram.update(values)
+
+    def merge(self, other : "ErrorStats"):
+        super().merge(other)
+        self.sketch.merge(other.sketch)
+        self.histogram.merge(other.histogram)
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {**super().state(),
+                **{"sketch." + key: value for key, value in self.sketch.state().items()},
+                **{"histogram." + key: value for key, value in self.histogram.state().items()}}
+
+    def load_state(self, state : dict):
+        super().load_state(state)
+        self.sketch.load_state(sub_state(state, "sketch."))
+        self.histogram.load_state(sub_state(state, "histogram."))
+
+    def percentile(self, p):
+        """Percentile of all samples, p in [0, 100]. The 100th percentile is exact."""
+        p = np.asarray(p, dtype=float)
+        return np.where(p >= 100, self.max.max(initial=-np.inf), self.sketch.quantile(p / 100))
+
+    def cdf(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.histogram.cdf()
+
+def sub_state(state : dict, prefix : str) -> dict:
+    """Entries of a state starting with prefix, without it"""
+    return {key[len(prefix):]: value for key, value in state.items() if key.startswith(prefix)}
+
+# Fields of PathLengthCounter.provenance()
+provenance_dtype = np.dtype([
+    ("iter", np.int32),
+    ("replica", np.int32),
+    ("node", np.int32),
+    ("source", np.int32),
+    ("hops", np.int32),
+])
+
+class PathLengthCounter:
+    """
+    Number of syncs by clock propagation path length (hops from node 0): counts[h]
+    syncs had path length h, path length 0 is not counted.
+
+    With provenance, every sync is also logged as (iteration, replica, node, source,
+    hops), in compact chunks that are only concatenated when provenance() is read.
+
+    Args:
+        nb_node: number of nodes, to split flat node indices into (replica, node)
+        provenance: keep the log of every sync
+    """
+
+    def __init__(self, nb_node, provenance=False):
+        self.nb_node = nb_node
+        self.counts = np.zeros(nb_node + 1, dtype=np.int64)
+        self.cur_iter = 0 # iteration logged with the syncs
+        self.chunks = [] if provenance else None
+
+    def add(self, hop_count, node=None, source=None):
+        """
+        Count syncs of the given path lengths.
+
+        Args:
+            hop_count: path length of every sync
+            node, source: flat indices (replica * nb_node + node) of the synced nodes
+                and their sources, needed for the provenance log
+        """
+        hop_count = np.ravel(hop_count)
+        counted = np.bincount(hop_count, minlength=len(self.counts))
+        if len(counted) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(counted) - len(self.counts), dtype=np.int64)])
+        self.counts[:len(counted)] += counted
+        self.counts[0] = 0
+        if self.chunks is not None and len(hop_count):
+            chunk = np.empty(len(hop_count), dtype=provenance_dtype)
+            chunk["iter"] = self.cur_iter
+            chunk["replica"], chunk["node"] = np.divmod(np.ravel(node), self.nb_node)
+            chunk["source"] = np.ravel(source) % self.nb_node
+            chunk["hops"] = hop_count
+            self.chunks.append(chunk)
+
+    def provenance(self) -> np.ndarray:
+        """Every sync logged so far, in sync order (see provenance_dtype)"""
+        assert self.chunks is not None, "Provenance is not logged"
+        if len(self.chunks) > 1:
+            self.chunks = [np.concatenate(self.chunks)]
+        return self.chunks[0] if self.chunks else np.empty(0, dtype=provenance_dtype)
+
+    def state(self) -> dict[str, np.ndarray]:
+        state = {"counts": self.counts, "cur_iter": np.array(self.cur_iter)}
+        if self.chunks is not None:
+            state["provenance"] = self.provenance()
+        return state
+
+    def load_state(self, state : dict):
+        self.counts = np.array(state["counts"], dtype=np.int64)
+        self.cur_iter = int(state["cur_iter"])
+        if self.chunks is not None:
+            self.chunks = [np.array(state["provenance"], dtype=provenance_dtype)]
+
+    def items(self):
+        """(path length, count) pairs of the path lengths seen"""
+        hops = np.flatnonzero(self.counts)
+        return zip(hops.tolist(), self.counts[hops].tolist())
@@ -0,0 +1,161 @@
+# Parallel parameter sweeps over the experiment factories in exps/
+
+import os
+import sys
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import topo
+from exps import syncwise as syncwise_exps, dtp as dtp_exps, firefly as firefly_exps
+from exps import graham as graham_exps, ptp as ptp_exps
+
+factories = {
+    "syncwise": syncwise_exps.syncwise,
+    "syncwise_skew": syncwise_exps.syncwise_skew,
+    "dtp": dtp_exps.dtp,
+    "firefly": firefly_exps.firefly,
+    "graham": graham_exps.graham,
+    "ptp": ptp_exps.ptp,
+}
+
+percentiles = [50, 99, 99.99, 100]
+
+def expand_grid(grid : dict[str, list]) -> list[dict]:
+    """
+    All combinations of a parameter grid, in a stable order.
+
+    Args:
+        grid: parameter name -> list of values. "algorithm" names a factory,
+            the other names are factory arguments (nb_node, nb_link, sync_interval_ns,
+            slice_duration_ns, dv_bound, hop_error_bound, ...). "topo" names a topology
+            in topo.generators in place of the factory's default one.
+            slice_duration_ns defaults to sync_interval_ns.
+    """
+    names = sorted(grid.keys())
+    runs = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        params = dict(zip(names, values))
+        if "sync_interval_ns" in params:
+            params.setdefault("slice_duration_ns", params["sync_interval_ns"])
+        runs.append(params)
+    return runs
+
+def _params_hash(params : dict) -> bytes:
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).digest()
+
+def run_seed(params : dict, seed) -> np.random.SeedSequence:
+    """
+    Seed of one run, derived from the root seed and the run's parameters only, so
+    that a run gets the same random numbers whatever else is in the grid
+    """
+    return np.random.SeedSequence(seed, spawn_key=(int.from_bytes(_params_hash(params)[:8], "little"),))
+
+def run_key(params : dict, iters : int, seed) -> str:
+    """Cache key of one run: its parameters, length and the root seed of the sweep"""
+    desc = json.dumps({
+        "params": params,
+        "iters": iters,
+        "seed": seed,
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(desc.encode()).hexdigest()
+
+def run_one(params : dict, iters : int, seed_seq : np.random.SeedSequence, start_record_from=0,
+            topo_cache_dir=None) -> dict:
+    """Build and run one simulator, return its summary. Runs in a worker process."""
+    params = dict(params)
+    factory = factories[params.pop("algorithm")]
+    if "topo" in params:
+        params["topo_func"] = topo.generators[params.pop("topo")]
+    sim = factory(
+        seed=seed_seq,
+        record_stats_only=True,
+        stats_start_iter=start_record_from,
+        topo_cache_dir=topo_cache_dir,
+        **params,
+    )
+    sim.run(iter=iters)
+
+    return {
+        "error_percentiles": sim.error_stats.percentile(percentiles),
+        "bound_percentiles": sim.bound_stats.percentile(percentiles),
+        "error_node_max": sim.error_stats.max,
+        "error_node_mean": sim.error_stats.mean(),
+        "bound_node_max": sim.bound_stats.max,
+        "bound_node_mean": sim.bound_stats.mean(),
+    }
+
+def save_result(path, params, result):
+    """Write a result atomically, so an interrupted sweep never leaves half a file"""
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, params=json.dumps(params, default=str), **result)
+    os.replace(tmp_path, path)
+
+def load_result(path) -> tuple[dict, dict]:
+    with np.load(path) as data:
+        params = json.loads(str(data["params"]))
+        result = {key: data[key] for key in data.files if key != "params"}
+    return params, result
+
+def sweep(grid : dict[str, list], iters : int, out_dir="sweep_results", seed=42, max_workers=None,
+          start_record_from=0, topo_cache_dir=None) -> list[tuple[dict, dict]]:
+    """
+    Run every combination of the grid in parallel.
+
+    Every run gets its own seed derived from seed and its parameters (see run_seed).
+    Results are cached in out_dir, keyed by parameters, length and seed, so a killed sweep
+    resumes where it stopped and a repeated or grown sweep only runs what is new.
+
+    Args:
+        grid: see expand_grid
+        iters: sync iterations per run
+        out_dir: directory of the cached results
+        seed: root seed of the sweep, an int
+        max_workers: number of worker processes, all cores by default
+        start_record_from: iterations skipped from the statistics
+        topo_cache_dir: directory of cached topologies and schedules (see topo_cache),
+            shared by the workers. Not part of the result key.
+
+    Returns:
+        (params, result) of every run, in grid order
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    runs = expand_grid(grid)
+    seed_seqs = [run_seed(params, seed) for params in runs]
+    paths = [os.path.join(out_dir, run_key(params, iters, seed) + ".npz") for params in runs]
+
+    todo = [i for i, path in enumerate(paths) if not os.path.exists(path)]
+    print(f"sweep: {len(runs)} runs, {len(runs) - len(todo)} cached")
+    if todo:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(run_one, runs[i], iters, seed_seqs[i], start_record_from, topo_cache_dir): i
+                for i in todo
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                save_result(paths[i], runs[i], future.result())
+                print(f"sweep: done {runs[i]}")
+
+    return [load_result(path) for path in paths]
+
+if __name__ == "__main__":
+    results = sweep(
+        grid={
+            "algorithm": ["syncwise", "graham"],
+            "nb_node": [16, 32],
+            "nb_link": [2],
+            "sync_interval_ns": [100 * 1000],
+            "dv_bound": [50],
+            "hop_error_bound": [5],
+        },
+        iters=100,
+        start_record_from=50,
+    )
+    for params, result in results:
+        print(params, np.round(result["error_percentiles"], 2))
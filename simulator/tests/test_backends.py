@@ -0,0 +1,30 @@
+import io
+import contextlib
+
+import numpy as np
+import pytest
+
+import algo
+import topo
+from simulator import Simulator
+
+pytest.importorskip("numba")
+
+@pytest.mark.parametrize("name, sync_algo, topo_func", [
+    ("syncwise", algo.syncwise, topo.opera),
+    ("graham", algo.graham, topo.opera),
+    ("dtp", algo.dtp, topo.static_tree),
+    ("ptp", algo.spanning_tree, topo.static_tree),
+    ("firefly", algo.firefly_optimized, topo.opera),
+])
+@pytest.mark.parametrize("replicas", [None, 3])
+def test_numba_noise_model(name, sync_algo, topo_func, replicas):
+    # The numba kernels take their hop errors from the provider's model, as the array versions do
+    errors = {}
+    for backend in ("numpy", "numba"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim = Simulator(name, sync_algo, 32, 4, topo_func, 50, None, backend=backend, replicas=replicas,
+                            noise_distributions={"hop_error": "biased_uniform"}, seed=3)
+            sim.run(40)
+        errors[backend] = sim.errors
+    assert np.array_equal(errors["numpy"], errors["numba"])
@@ -0,0 +1,52 @@
+import io
+import copy
+import pickle
+import contextlib
+
+import numpy as np
+
+import algo
+import para
+import topo
+from simulator import Simulator
+
+def test_sum_runtime_drift_variance_biased_model():
+    # 20 draws per node: the closed form must match the exact sum of the model's draws
+    bound = np.full(4000, 10.0)
+    exact = para.sum_runtime_drift_variance(
+        para.NoiseProvider(np.random.default_rng(1), distributions={"drift_variance": "biased_uniform"}),
+        bound, 20, nb_exact=20)
+    closed = para.sum_runtime_drift_variance(
+        para.NoiseProvider(np.random.default_rng(2), distributions={"drift_variance": "biased_uniform"}),
+        bound, 20, nb_exact=8)
+    assert abs(exact.mean() + 200) < 2
+    assert abs(closed.mean() - exact.mean()) < 2
+    assert abs(closed.std() / exact.std() - 1) < 0.1
+    assert closed.max() <= 0
+
+def test_sum_runtime_drift_variance_estimated_moments():
+    bound = np.full(4000, 10.0)
+    rng = para.NoiseProvider(np.random.default_rng(3), distributions={"drift_variance": "choice"})
+    closed = para.sum_runtime_drift_variance(rng, bound, 30)
+    # choice draws -1, 1, 1: mean 1/3, variance 8/9
+    assert abs(closed.mean() - 100) < 2
+    assert abs(closed.std() - 10 * np.sqrt(30 * 8 / 9)) < 3
+
+def test_noise_provider_copy():
+    rng = para.NoiseProvider(np.random.default_rng(4), block_size=16, distributions={"hop_error": "biased_uniform"})
+    rng.hop_errors(10, 5)
+    copy.copy(rng)
+    clones = [copy.deepcopy(rng), pickle.loads(pickle.dumps(rng))]
+    # The same draws continue, from the buffers and from the generator
+    expected = rng.hop_errors(40, 5), rng.integers(0, 1000, 8)
+    for clone in clones:
+        assert np.array_equal(clone.hop_errors(40, 5), expected[0])
+        assert np.array_equal(clone.integers(0, 1000, 8), expected[1])
+
+def test_simulator_with_noise_provider_copy():
+    sim = Simulator("graham", algo.graham, 16, 2, topo.opera, 50, None, noise_distributions={"hop_error": "normal"})
+    clone = copy.deepcopy(sim)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(10)
+        clone.run(10)
+    assert np.array_equal(sim.errors, clone.errors)
@@ -0,0 +1,39 @@
+import io
+import contextlib
+
+import numpy as np
+import pytest
+
+import results
+from exps import syncwise as syncwise_exps
+
+pytest.importorskip("pyarrow")
+
+def run(result_dir, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = syncwise_exps.syncwise(16, 2, 1000, 1000, dv_bound=50, hop_error_bound=5,
+                                     result_dir=result_dir, result_chunk_iters=4, **kwargs)
+        sim.run(10)
+    return sim
+
+def test_round_trip(tmp_path):
+    sim = run(tmp_path / "run")
+    data = results.Results(tmp_path / "run").read()
+    assert np.array_equal(data["iter"], np.arange(10))
+    assert np.array_equal(data["error"], sim.errors) and np.array_equal(data["bound"], sim.bounds)
+
+def test_existing_results(tmp_path):
+    run(tmp_path / "run")
+    with pytest.raises(ValueError):
+        run(tmp_path / "run")
+    sim = run(tmp_path / "run", result_mode="overwrite")
+    assert np.array_equal(results.Results(tmp_path / "run").read()["error"], sim.errors)
+    with pytest.raises(ValueError):
+        run(tmp_path / "run", result_mode="append", seed=1)
+
+def test_read_duplicate_iterations(tmp_path):
+    # Appending the same iterations again is caught when reading
+    run(tmp_path / "run")
+    run(tmp_path / "run", result_mode="append")
+    with pytest.raises(ValueError):
+        results.Results(tmp_path / "run").read()
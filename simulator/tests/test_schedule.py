@@ -0,0 +1,77 @@
+import io
+import contextlib
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import algo
+import topo
+from schedule import Schedule
+from simulator import Simulator
+
+def assert_same_slices(schedule, expected):
+    for slice_id in range(len(schedule)):
+        cur_slice, expected_slice = schedule[slice_id], expected[slice_id]
+        for arr, expected_arr in zip(cur_slice.csr, expected_slice.csr):
+            assert np.array_equal(arr, expected_arr)
+        assert np.array_equal(cur_slice.hop_distances(), expected_slice.hop_distances())
+
+def assert_bfs_distances(cur_slice):
+    nodes, indptr, indices = cur_slice.csr
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes.tolist())
+    graph.add_edges_from(zip(np.repeat(nodes, np.diff(indptr)).tolist(), indices.tolist()))
+    dist = cur_slice.hop_distances()
+    for source, lengths in nx.all_pairs_shortest_path_length(graph):
+        assert np.flatnonzero(dist[source] >= 0).tolist() == sorted(lengths)
+        assert all(dist[source, node] == length for node, length in lengths.items())
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_remove_links(compact):
+    rng = np.random.default_rng(0)
+    circuits = topo.opera(rng, 32, 4)
+    cur_topo = topo.generate_compact_topo(32, circuits) if compact else topo.generate_topo(32, circuits)
+    schedule = Schedule(cur_topo)
+    for slice_id in range(len(schedule)):
+        schedule[slice_id].hop_distances() # updated by remove_links
+    links = [tuple(edge) for slice_id in (0, 3) for edge in
+             rng.choice(np.array(schedule[slice_id].graph.edges()), size=12, replace=False).tolist()]
+    # Twice, as the links of fail_links add up
+    schedule.remove_links(links[:10])
+    schedule.remove_links(links[10:])
+
+    expected = Schedule(cur_topo, failed_link=links)
+    assert_same_slices(schedule, expected)
+    for slice_id in range(len(schedule)):
+        assert_bfs_distances(schedule[slice_id])
+    assert schedule.fingerprint() == expected.fingerprint()
+
+def test_remove_links_lazy():
+    rng = np.random.default_rng(0)
+    cur_topo = topo.opera_lazy(rng, 32, 4)
+    links = [(0, 5), (3, 9), (7, 8), (1, 1)]
+    schedule = Schedule(cur_topo, max_slices=2)
+    schedule.remove_links(links)
+    expected = Schedule(cur_topo, failed_link=links, max_slices=2)
+    assert_same_slices(schedule, expected)
+    assert schedule.fingerprint() == expected.fingerprint()
+
+def test_fail_links():
+    def make():
+        return Simulator("syncwise", algo.syncwise, 32, 4, topo.opera, 50, None, seed=1)
+    links = [(0, 5), (3, 9), (7, 8)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim, expected = make(), make()
+        sim.fail_links(links)
+        expected.schedule = Schedule(expected.topo, failed_link=links)
+        sim.run(20)
+        expected.run(20)
+        assert np.array_equal(sim.errors, expected.errors)
+
+        resumed = make()
+        resumed.load_state(*sim.state())
+        sim.run(10)
+        resumed.run(10)
+    assert resumed.schedule.fingerprint() == sim.schedule.fingerprint()
+    assert np.array_equal(resumed.errors, sim.errors)
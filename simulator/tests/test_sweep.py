@@ -0,0 +1,28 @@
+import numpy as np
+
+import sweep
+
+grid = {
+    "algorithm": ["graham"],
+    "nb_node": [16, 32],
+    "nb_link": [2],
+    "sync_interval_ns": [1000],
+    "dv_bound": [50],
+    "hop_error_bound": [5],
+}
+
+def test_grown_grid_reuses_results(tmp_path, capsys):
+    first = sweep.sweep(grid, iters=10, out_dir=str(tmp_path), max_workers=1)
+    capsys.readouterr()
+    second = sweep.sweep({**grid, "nb_node": [8, 16, 32]}, iters=10, out_dir=str(tmp_path), max_workers=1)
+    assert "3 runs, 2 cached" in capsys.readouterr().out
+    for (params, result), (new_params, new_result) in zip(first, second[1:]):
+        assert params == new_params
+        assert np.array_equal(result["error_percentiles"], new_result["error_percentiles"])
+
+def test_run_seed_depends_on_params_only():
+    runs = sweep.expand_grid(grid)
+    assert sweep.run_seed(runs[1], 42).generate_state(4).tolist() == \
+        sweep.run_seed(dict(runs[1]), 42).generate_state(4).tolist()
+    assert sweep.run_seed(runs[0], 42).generate_state(4).tolist() != \
+        sweep.run_seed(runs[1], 42).generate_state(4).tolist()
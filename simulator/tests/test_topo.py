@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+import topo
+
+@pytest.mark.parametrize("nb_node", [32, 33])
+@pytest.mark.parametrize("nb_link", [1, 4])
+def test_opera_lazy(nb_node, nb_link):
+    lazy = topo.opera_lazy(np.random.default_rng(3), nb_node, nb_link)
+    expected = topo.generate_compact_topo(nb_node, topo.opera(np.random.default_rng(3), nb_node, nb_link))
+    assert len(lazy) == len(expected)
+    assert np.array_equal(lazy.nodes, expected.nodes)
+    nb_dummy = 0
+    for slice_id in range(len(expected)):
+        edges, ports = lazy.slice_edges(slice_id)
+        expected_edges, expected_ports = expected.slice_edges(slice_id)
+        # The dummy node of an odd opera only has its self loop left
+        real = (expected_edges != -1).all(axis=1)
+        nb_dummy += len(real) - real.sum()
+        assert np.array_equal(edges, expected_edges[real])
+        assert np.array_equal(ports, expected_ports[real])
+    assert nb_dummy == nb_node % 2
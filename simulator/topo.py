@@ -7,11 +7,36 @@ import numpy as np
 import itertools
 import random
 
+import utils
+
 """
 Circuit:
 [time_slice, node1, node2, port1, port2]
 """
 
+# Circuits as a structured array, one record per circuit
+circuit_dtype = np.dtype([
+    ("ts", np.int32),
+    ("node1", np.int32),
+    ("node2", np.int32),
+    ("port1", np.int16),
+    ("port2", np.int16),
+])
+
+def make_circuits(ts, node1, node2, port1, port2) -> np.ndarray:
+    """Circuit array from its columns"""
+    circuits = np.empty(len(ts), dtype=circuit_dtype)
+    circuits["ts"], circuits["node1"], circuits["node2"] = ts, node1, node2
+    circuits["port1"], circuits["port2"] = port1, port2
+    return circuits
+
+def to_circuits(circuits) -> np.ndarray:
+    """Circuit array of a list of [time_slice, node1, node2, port1, port2] (or a circuit array)"""
+    if isinstance(circuits, np.ndarray) and circuits.dtype == circuit_dtype:
+        return circuits
+    rows = np.asarray(circuits, dtype=np.int64).reshape(-1, 5)
+    return make_circuits(*rows.T)
+
 def generate_topo(nb_nodes, circuits) -> dict[int,nx.Graph]:
     """
     Generate topologies (in networkx graph) based on given circuits
@@ -30,6 +55,8 @@ def generate_topo(nb_nodes, circuits) -> dict[int,nx.Graph]:
         #nx.draw(circuits, with_labels=True)
         plt.show()
         return {0: circuits}
+    if isinstance(circuits, np.ndarray):
+        circuits = circuits.tolist()
 
     slice_to_topo = {}
 
@@ -48,6 +75,173 @@ def generate_topo(nb_nodes, circuits) -> dict[int,nx.Graph]:
 
     return slice_to_topo
 
+class SliceTopo:
+    """
+    Topologies of all time slices, read like the dictionary of generate_topo without a
+    networkx graph per slice. topo[k] builds the networkx graph of slice k on demand,
+    e.g. for drawing, while the Schedule compiles slice_edges directly.
+
+    Subclasses give nodes, __len__ and slice_edges.
+    """
+
+    def keys(self):
+        return range(len(self))
+
+    def items(self):
+        for slice_id in self.keys():
+            yield slice_id, self[slice_id]
+
+    def __getitem__(self, slice_id) -> nx.Graph:
+        """networkx graph of a slice, the same as generate_topo gives"""
+        graph = nx.Graph()
+        graph.add_nodes_from(self.nodes.tolist())
+        edges, ports = self.slice_edges(slice_id)
+        for (node1, node2), (port1, port2) in zip(edges.tolist(), ports.tolist()):
+            graph.add_edge(node1, node2, port1=port1, port2=port2)
+        return graph
+
+    def slice_edges(self, slice_id) -> tuple[np.ndarray, np.ndarray]:
+        """Circuits of a slice in circuit order: node pairs and port pairs"""
+        raise NotImplementedError
+
+    def csr(self, slice_id) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR adjacency of a slice, the same as utils.get_csr(self[slice_id])"""
+        return utils.csr_from_edges(self.nodes, self.slice_edges(slice_id)[0])
+
+    def graph_edges(self, slice_id) -> np.ndarray:
+        """Edges of a slice in the order of self[slice_id].edges()"""
+        return utils.csr_edges(self.csr(slice_id))
+
+class CompactTopo(SliceTopo):
+    """
+    Circuits of all time slices as flat arrays: the circuits of slice k are
+    edges[offsets[k]:offsets[k+1]] (int32 node pairs) with their ports in ports
+    (int16 port pairs), in circuit order.
+    """
+
+    def __init__(self, nodes : np.ndarray, edges : np.ndarray, ports : np.ndarray, offsets : np.ndarray):
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+        self.ports = np.asarray(ports, dtype=np.int16).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_graph(cls, graph : nx.Graph) -> "CompactTopo":
+        """A static topology, one time slice"""
+        edges = np.array([(u, v) for u, v in graph.edges()], dtype=np.int32).reshape(-1, 2)
+        ports = np.array([(data.get("port1", 0), data.get("port2", 0)) for _, _, data in graph.edges(data=True)],
+                         dtype=np.int16).reshape(-1, 2)
+        return cls(np.array(graph.nodes()), edges, ports, [0, len(edges)])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def slice_edges(self, slice_id) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[slice_id], self.offsets[slice_id + 1]
+        return self.edges[start:end], self.ports[start:end]
+
+def circle_matching(nodes : np.ndarray, slice_id) -> np.ndarray:
+    """
+    Pairs of round-robin slice slice_id by the circle method in closed form, the same
+    as round_robin: node 0 stays, the others have rotated slice_id times. nodes has an
+    even length, -1 marks the dummy node, whose pairs are left out.
+    """
+    nb_node = len(nodes)
+    pos = np.arange(nb_node)
+    pos[1:] = 1 + (pos[1:] - 1 - slice_id) % (nb_node - 1)
+    rotated = nodes[pos]
+    pairs = np.stack([rotated[:nb_node // 2], rotated[::-1][:nb_node // 2]], axis=1)
+    return pairs[(pairs != -1).all(axis=1)]
+
+class RoundRobinTopo(SliceTopo):
+    """
+    Lazy round-robin based schedule (round_robin, opera): the circuits of a slice are
+    computed when asked for, from the circle method, and no circuit list is kept.
+
+    Base round-robin slice order[t] (slice nb_node-1 being the self loops) takes the
+    place t, and the nb_link places t of slice k = t // nb_link use port t % nb_link.
+
+    With an odd number of nodes, the loop-back slice has no self loop of the dummy
+    node: round_robin_circuits gives it a (-1, -1) circuit, which is not a link of
+    any node (and makes the slice graph of generate_topo have one more node).
+    """
+
+    def __init__(self, nodes, nb_link=1, order=None, self_loop=False):
+        """
+        Args:
+            nodes: node ids
+            nb_link: base slices merged into one slice, one per port
+            order: base slice at each place, in order by default
+            self_loop: whether there is the loop-back base slice
+        """
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.nb_link = nb_link
+        self.self_loop = self_loop
+        # -1 is the dummy node of an odd round robin
+        self.circle = self.nodes if len(self.nodes) % 2 == 0 else np.append(self.nodes, -1)
+        self.nb_base_slice = len(self.circle) - 1 + self_loop
+        self.order = np.arange(self.nb_base_slice) if order is None else np.asarray(order)
+
+    def __len__(self):
+        return -(-self.nb_base_slice // self.nb_link)
+
+    def base_pairs(self, base_slice) -> np.ndarray:
+        if base_slice == len(self.circle) - 1:
+            # Self loops. Those of the dummy are left out
+            return np.repeat(self.nodes[:, None], 2, axis=1)
+        return circle_matching(self.circle, base_slice)
+
+    def slice_edges(self, slice_id) -> tuple[np.ndarray, np.ndarray]:
+        places = range(slice_id * self.nb_link, min((slice_id + 1) * self.nb_link, self.nb_base_slice))
+        pairs = [self.base_pairs(self.order[place]) for place in places]
+        ports = [np.full((len(pair), 2), place % self.nb_link) for place, pair in zip(places, pairs)]
+        return np.concatenate(pairs).astype(np.int32), np.concatenate(ports).astype(np.int16)
+
+def round_robin_lazy(nb_node=None, nodes=None, self_loop=False) -> RoundRobinTopo:
+    """Lazy version of round_robin with the default ports"""
+    if nodes is None:
+        nodes = np.arange(nb_node)
+    return RoundRobinTopo(nodes, self_loop=self_loop)
+
+def opera_lazy(rng, nb_node, nb_link, nodes = None) -> RoundRobinTopo:
+    """
+    Lazy version of opera, with the same slices for the same rng. Only the random
+    order of the base slices is stored.
+
+    With an odd nb_node, the slice of the loop-back base slice lacks the (-1, -1)
+    circuit of the dummy node that opera has (see RoundRobinTopo), all other
+    circuits and ports are the same.
+    """
+    if nodes is None:
+        nodes = np.arange(nb_node)
+    nb_base_slice = len(nodes) + len(nodes) % 2 # with the loop-back slice
+    # topo_randomize_ts moves base slice ts to place shuffled[ts]
+    shuffled = list(range(nb_base_slice))
+    rng.shuffle(shuffled)
+    return RoundRobinTopo(nodes, nb_link, order=np.argsort(shuffled), self_loop=True)
+
+def generate_compact_topo(nb_nodes, circuits) -> CompactTopo:
+    """
+    Compact version of generate_topo, see CompactTopo
+
+    Args:
+        nb_nodes: number of nodes
+        circuits: [time_slice, node1, node2, port1, port2] rows, a nx.Graph, or
+            a SliceTopo (e.g. from opera_lazy) that is returned as is
+    """
+    if isinstance(circuits, nx.Graph):
+        return CompactTopo.from_graph(circuits)
+    if isinstance(circuits, SliceTopo):
+        return circuits
+
+    circuits = to_circuits(circuits)
+    # Group by time slice, keeping the circuit order within a slice
+    circuits = sort_circuits(circuits, "ts")
+    nb_slice = int(circuits["ts"].max(initial=-1)) + 1
+    offsets = np.searchsorted(circuits["ts"], np.arange(nb_slice + 1))
+    return CompactTopo(np.arange(nb_nodes), np.stack([circuits["node1"], circuits["node2"]], axis=1),
+                       np.stack([circuits["port1"], circuits["port2"]], axis=1), offsets)
+
 def static_tree(rng, nb_node, nb_link) -> nx.Graph:
     """Create a tree"""
     tree = nx.full_rary_tree(r=nb_link, n=nb_node)
@@ -60,12 +254,100 @@ def static_tree(rng, nb_node, nb_link) -> nx.Graph:
     return tree
     #return nx.balanced_tree(nb_node, nb_link)
 
-def clos(nb_node, nb_link) -> nx.Graph:
-    pass
-def flat(nb_node, nb_link) -> nx.Graph:
+def clos(rng, nb_node, nb_link) -> np.ndarray:
+    """
+    Two-tier folded Clos (leaf-spine). Nodes 0 .. nb_link-1 are the spines, the
+    others are leaves, and every leaf connects its port p to spine p. A spine uses
+    port i for leaf i.
+    Returns:
+        Circuits of one time slice
+    """
+    nb_leaf = nb_node - nb_link
+    if nb_leaf < 1:
+        raise ValueError(f"Clos with {nb_link} spines needs more than {nb_link} nodes")
+    if nb_leaf > np.iinfo(np.int16).max:
+        raise ValueError(f"Too many leaves ({nb_leaf}) for the ports of a spine")
+
+    leaf = np.repeat(np.arange(nb_link, nb_node), nb_link)
+    spine = np.tile(np.arange(nb_link), nb_leaf)
+    return make_circuits(np.zeros(len(leaf)), leaf, spine, spine, leaf - nb_link)
+
+def fat_tree(rng, nb_node, nb_link) -> np.ndarray:
+    """
+    Three-tier k-ary fat-tree of switches with k = 2 * nb_link: every switch has nb_link
+    ports down and nb_link up, so nb_node must be 5 * nb_link ** 2.
+    Nodes are the k^2/4 core switches first, then pod by pod the k/2 aggregation and
+    the k/2 edge switches. Aggregation switch i of a pod connects its port nb_link + j
+    to core i * nb_link + j (core port: the pod), edge switch e connects its port i to
+    aggregation switch i (aggregation port: e).
+    Returns:
+        Circuits of one time slice
+    """
+    half = nb_link
+    nb_core, nb_pod = half * half, 2 * half
+    if nb_node != nb_core + nb_pod * 2 * half:
+        raise ValueError(f"A fat-tree with {nb_link} links has {5 * nb_link ** 2} nodes, not {nb_node}")
+
+    pod, i, j = (arr.ravel() for arr in np.meshgrid(np.arange(nb_pod), np.arange(half), np.arange(half), indexing="ij"))
+    agg = nb_core + pod * 2 * half + i
+    edge = nb_core + pod * 2 * half + half + j
+    # Aggregation to core: (pod, i, j) is aggregation i to core i * half + j
+    core_circuits = make_circuits(np.zeros(len(pod)), agg, i * half + j, half + j, pod)
+    # Edge to aggregation: (pod, i, j) is edge j to aggregation i
+    agg_circuits = make_circuits(np.zeros(len(pod)), edge, agg, i, j)
+    return np.concatenate([core_circuits, agg_circuits])
+
+def expander(rng, nb_node, nb_link, max_tries=1000) -> np.ndarray:
+    """
+    Random nb_link-regular graph (Jellyfish): ports are paired at random and the pairs
+    that make self loops or duplicate links are paired again, together with as many
+    random pairs, until there is none left.
+    Returns:
+        Circuits of one time slice, the port of a node is the index of its link
+    """
+    if nb_link >= nb_node or nb_node * nb_link % 2:
+        raise ValueError(f"No {nb_link}-regular graph with {nb_node} nodes")
+    if 2 * nb_link > nb_node:
+        # Dense: the complement of a sparse random regular graph
+        sparse = expander(rng, nb_node, nb_node - 1 - nb_link, max_tries)
+        adj = np.eye(nb_node, dtype=bool)
+        adj[sparse["node1"], sparse["node2"]] = adj[sparse["node2"], sparse["node1"]] = True
+        node1, node2 = np.nonzero(np.triu(~adj))
+        # Ports numbered in link order at every node
+        ends = np.concatenate([node1, node2])
+        order = np.argsort(ends, kind="stable")
+        port = np.empty(len(ends), dtype=np.int64)
+        port[order] = np.arange(len(ends)) - np.repeat(np.arange(nb_node) * nb_link, nb_link)
+        return make_circuits(np.zeros(len(node1)), node1, node2, port[:len(node1)], port[len(node1):])
+
+    # Port p of node n is stub n * nb_link + p
+    stubs = rng.permutation(nb_node * nb_link)
+    pairs = stubs.reshape(-1, 2)
+    for _ in range(max_tries):
+        node1, node2 = pairs[:, 0] // nb_link, pairs[:, 1] // nb_link
+        link = np.minimum(node1, node2) * nb_node + np.maximum(node1, node2)
+        order = np.argsort(link, kind="stable")
+        bad = node1 == node2
+        bad[order[1:]] |= link[order[1:]] == link[order[:-1]]
+        if not bad.any():
+            break
+        redo = np.union1d(np.flatnonzero(bad), rng.choice(len(pairs), size=bad.sum(), replace=False))
+        pairs[redo] = rng.permutation(pairs[redo].ravel()).reshape(-1, 2)
+    else:
+        raise RuntimeError(f"No {nb_link}-regular graph with {nb_node} nodes found in {max_tries} tries")
+
+    return make_circuits(np.zeros(len(pairs)), node1, node2, pairs[:, 0] % nb_link, pairs[:, 1] % nb_link)
+
+def flat(rng, nb_node, nb_link) -> nx.Graph:
     assert nb_node > 1
     return nx.star_graph(n=nb_node-1)
     
+def sort_circuits(circuits : np.ndarray, field) -> np.ndarray:
+    """Circuits stably sorted by field, as list.sort(key=...) would"""
+    if (np.diff(circuits[field]) >= 0).all():
+        return circuits
+    return circuits[np.argsort(circuits[field], kind="stable")]
+
 def round_robin(nb_node=None, nb_link=1, nodes=None, port1=0, port2=0, self_loop=False) -> list:
     """
     Create a round-robin topology with the circle method. Assume one upper link per node.
@@ -86,37 +368,33 @@ def round_robin(nb_node=None, nb_link=1, nodes=None, port1=0, port2=0, self_loop
     
     if nodes is None:
         assert nb_node is not None, "Need either nb_node or node"
-        nodes = list(range(nb_node))
-    else:
-        nb_node = len(nodes)
-        if isinstance(nodes, np.ndarray):
-            nodes = nodes.tolist()
-
-    #assert nb_node % 2 == 0, "Round-robin needs number of nodes to be even."
-    if nb_node % 2 == 1:
-        nb_node = nb_node + 1
-        nodes.append(-1) # -1 indicate dummy node
+        nodes = np.arange(nb_node)
 
-    circuits = []
+    return [list(circuit) for circuit in round_robin_circuits(nodes, port1, port2, self_loop).tolist()]
 
-    for slice_id in range(nb_node - 1):
-        for i in range(nb_node // 2):
-            if nodes[i] == -1 or nodes[-i-1] == -1:
-                # does not connect dummy node
-                continue
-            circuits.append(
-                [slice_id, nodes[i], nodes[-i-1], port1, port2]
-            )
-        nodes.insert(1, nodes.pop(-1))
+def round_robin_circuits(nodes, port1=0, port2=0, self_loop=False) -> np.ndarray:
+    """round_robin as a circuit array, one vectorized matching per slice"""
+    circle = np.asarray(nodes, dtype=np.int64)
+    #assert nb_node % 2 == 0, "Round-robin needs number of nodes to be even."
+    if len(circle) % 2 == 1:
+        circle = np.append(circle, -1) # -1 indicate dummy node
+    nb_node = len(circle)
 
+    # Pairs with the dummy node are not connected
+    pairs = [circle_matching(circle, slice_id) for slice_id in range(nb_node - 1)]
     # Add a loop-back time slice for being the building block of more complex topology
     if self_loop == True:
-        for node_id in range(nb_node):
-            circuits.append(
-                [nb_node-1, nodes[node_id], nodes[node_id], port1, port2]
-            )
+        pairs.append(np.repeat(circle[:, None], 2, axis=1))
+    pairs_of_slice = np.array([len(pair) for pair in pairs], dtype=np.int64)
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
 
-    return circuits
+    return make_circuits(np.repeat(np.arange(len(pairs_of_slice)), pairs_of_slice),
+                         pairs[:, 0], pairs[:, 1], port1, port2)
+
+def merge_slices(circuits : np.ndarray, nb_link) -> np.ndarray:
+    """Merge every nb_link time slices into one, slice ts taking port ts % nb_link"""
+    port_id = circuits["ts"] % nb_link
+    return make_circuits(circuits["ts"] // nb_link, circuits["node1"], circuits["node2"], port_id, port_id)
 
 def opera(rng, nb_node, nb_link, nodes = None):
     """
@@ -126,7 +404,7 @@ def opera(rng, nb_node, nb_link, nodes = None):
     """
 
     # First we generate a basic round robin that each node connects every other node.
-    base_circuits = round_robin(nb_node = nb_node, nodes = nodes, self_loop=True)
+    base_circuits = round_robin_circuits(np.arange(nb_node) if nodes is None else nodes, self_loop=True)
     # e.g. 4 nodes, 2 links
     # slice0: 0(p0) <-> 3(p0), 1(p0) <-> 2(p0)
     # slice1: 0(p0) <-> 2(p0), 1(p0) <-> 3(p0)
@@ -141,10 +419,7 @@ def opera(rng, nb_node, nb_link, nodes = None):
     # With two upper links, we map old_ts to new_ts by (2n -> n), (2n+1 -> n)
     # With three upper links, we map old_ts to new_ts by (3n -> n), (3n+1 -> n), (3n+2 -> n)
 
-    merged_circuit = []
-    for ts, node1, node2, port1, port2 in base_circuits:
-        port_id = ts % nb_link
-        merged_circuit.append([ts//nb_link, node1, node2, port_id, port_id])
+    merged_circuit = merge_slices(base_circuits, nb_link)
     # e.g. 4 nodes, 2 links
     # slice0: 0(p0) <-> 3(p0), 0(p1) <-> 2(p1), 1(p0) <-> 2(p0), 1(p1) <-> 3(p1)
     # slice1: 0(p0) <-> 1(p0), 0&1 (p1)   loop, 2(p0) <-> 3(p0), 2&3 (p1)   loop
@@ -163,7 +438,7 @@ def opera_skew(rng, nb_node, nb_link, skew_ratio, nodes = None):
     """
 
     # First we generate a basic round robin that each node connects every other node.
-    base_circuits = round_robin(nb_node = nb_node, nodes = nodes, self_loop=True)
+    base_circuits = round_robin_circuits(np.arange(nb_node) if nodes is None else nodes, self_loop=True)
     # e.g. 4 nodes, 2 links
     # slice0: 0(p0) <-> 3(p0), 1(p0) <-> 2(p0)
     # slice1: 0(p0) <-> 2(p0), 1(p0) <-> 3(p0)
@@ -178,10 +453,7 @@ def opera_skew(rng, nb_node, nb_link, skew_ratio, nodes = None):
     # With two upper links, we map old_ts to new_ts by (2n -> n), (2n+1 -> n)
     # With three upper links, we map old_ts to new_ts by (3n -> n), (3n+1 -> n), (3n+2 -> n)
 
-    merged_circuit = []
-    for ts, node1, node2, port1, port2 in base_circuits:
-        port_id = ts % nb_link
-        merged_circuit.append([ts//nb_link, node1, node2, port_id, port_id])
+    merged_circuit = merge_slices(base_circuits, nb_link)
     # e.g. 4 nodes, 2 links
     # slice0: 0(p0) <-> 3(p0), 0(p1) <-> 2(p1), 1(p0) <-> 2(p0), 1(p1) <-> 3(p1)
     # slice1: 0(p0) <-> 1(p0), 0&1 (p1)   loop, 2(p0) <-> 3(p0), 2&3 (p1)   loop
@@ -192,6 +464,14 @@ def opera_skew(rng, nb_node, nb_link, skew_ratio, nodes = None):
 
     return skew_circuit
 
+def rotor(rng, nb_node, nb_link, nodes = None):
+    """
+    RotorNet-style schedule: the opera matchings, but the nb_link rotors reconfigure
+    one after another instead of all at once. Port p changes at the slices
+    p mod nb_link, and each of its circuits stays up nb_link slices.
+    """
+    return port_offset(opera(rng, nb_node, nb_link, nodes))
+
 def shale(nb_node, h, nodes = None):
     """
     We assume num of links == h, so rr in different dimension doesn't influence each other.
@@ -217,76 +497,59 @@ def shale(nb_node, h, nodes = None):
 
     return circuits
 
-def topo_randomize_ts(rng, circuits : list):
+def topo_randomize_ts(rng, circuits) -> np.ndarray:
     """
     Randomize connection order (time_slice -> connections mapping) for circuits.
+    Circuits are ordered by port2 first (stable), a circuit of slice ts moves to slice
+    shuffled[ts], and the result is ordered by the new slice (stable).
     """
-    circuits.sort(key = lambda x: x[4])
-    #print(circuits)
+    circuits = to_circuits(circuits)
+    circuits = sort_circuits(circuits, "port2")
 
-    ts_set = set()
-    for ts, node1, node2, port1, port2 in circuits:
-        ts_set.add(ts)
-
-    time_slices = sorted(list(ts_set))
-    shuffled = time_slices.copy()
+    shuffled = np.unique(circuits["ts"])
     rng.shuffle(shuffled)
 
-    shuffled_circuits = []
-    for ts, node1, node2, port1, port2 in circuits:
-        shuffled_circuits.append([shuffled[ts], node1, node2, port1, port2])
+    shuffled_circuits = circuits.copy()
+    shuffled_circuits["ts"] = shuffled[circuits["ts"]]
 
     # Sort based on time slice
-    shuffled_circuits.sort(key = lambda x: x[0])
-    #print(shuffled_circuits)
-
-    return shuffled_circuits
+    return sort_circuits(shuffled_circuits, "ts")
 
-def make_topo_skew(circuits : list, skew_ratio):
+def make_topo_skew(circuits, skew_ratio) -> np.ndarray:
     """
     Duplicate the first half of the circuits skew_ratio times
     """
-    circuits.sort(key = lambda x: x[4])
-    #print(circuits)
+    circuits = to_circuits(circuits)
+    circuits = sort_circuits(circuits, "port2")
+    half = len(np.unique(circuits["ts"])) // 2
 
-    ts_set = set()
-    for ts, node1, node2, port1, port2 in circuits:
-        ts_set.add(ts)
-
-    skew_circuits = []
-    for ts, node1, node2, port1, port2 in circuits:
-        skew_circuits.append([ts, node1, node2, port1, port2])
-        if ts < len(ts_set) // 2:
-            for i in range(1, skew_ratio+1):
-                skew_circuits.append([ts + (len(ts_set)//2) * i, node1, node2, port1, port2])
+    # Every circuit of the first half is followed by its skew_ratio copies, copy i moved by half * i slices
+    nb_copy = np.where(circuits["ts"] < half, skew_ratio + 1, 1)
+    skew_circuits = np.repeat(circuits, nb_copy)
+    copy_id = np.arange(len(skew_circuits)) - np.repeat(np.cumsum(nb_copy) - nb_copy, nb_copy)
+    skew_circuits["ts"] += half * copy_id
 
     # Sort based on time slice
-    skew_circuits.sort(key = lambda x: x[0])
-
-    return skew_circuits
+    return sort_circuits(skew_circuits, "ts")
 
-def port_offset(circuits : list):
+def port_offset(circuits) -> np.ndarray:
     """
     Helper function to transform the circuits to reconfigure topology one port per time slice.
     New nb_time_slice = old nb_time_slice * nb_links
     """
-
+    circuits = to_circuits(circuits)
     nb_time_slice = get_nb_time_slice_from_circuits(circuits)
     nb_links = get_nb_links_from_circuits(circuits)
+    assert (circuits["port1"] == circuits["port2"]).all(), "To enable port offset, port id should be the same for both side."
 
-    offset_circuits = []
-    for ts, node1, node2, port1, port2 in circuits:
-        assert port1 == port2, "To enable port offset, port id should be the same for both side."
-        new_ts_start = ts * nb_links + port1
-        new_ts_end = (ts+1) * nb_links + port1
-        for new_ts in range(new_ts_start, new_ts_end):
-            offset_circuits.append([
-                new_ts % (nb_time_slice * nb_links), node1, node2, port1, port2
-            ])
-    
+    # Every circuit stays up nb_links slices from ts * nb_links + port
+    offset_circuits = np.repeat(circuits, nb_links)
+    new_ts = (np.repeat(circuits["ts"].astype(np.int64) * nb_links + circuits["port1"], nb_links)
+              + np.tile(np.arange(nb_links), len(circuits)))
+    offset_circuits["ts"] = new_ts % (nb_time_slice * nb_links)
     return offset_circuits
 
-def get_nb_time_slice_from_circuits(circuits : list):
+def get_nb_time_slice_from_circuits(circuits):
     """
     Helper function
     Args:
@@ -294,13 +557,9 @@ def get_nb_time_slice_from_circuits(circuits : list):
     Returns:
         The number of time slices
     """
-    max_ts = 0
-    for ts, node1, node2, port1, port2 in circuits:
-        if ts > max_ts:
-            max_ts = ts
-    return max_ts + 1
+    return int(to_circuits(circuits)["ts"].max(initial=0)) + 1
 
-def get_nb_links_from_circuits(circuits : list):
+def get_nb_links_from_circuits(circuits):
     """
     Helper function
     Args:
@@ -308,13 +567,20 @@ def get_nb_links_from_circuits(circuits : list):
     Returns:
         The number of links
     """
-    max_port = 0
-    for ts, node1, node2, port1, port2 in circuits:
-        if port1 > max_port:
-            max_port = port1
-        if port2 > max_port:
-            max_port = port2
-    return max_port + 1
+    circuits = to_circuits(circuits)
+    return int(max(circuits["port1"].max(initial=0), circuits["port2"].max(initial=0))) + 1
+
+# Topology functions by name, all called as topo_func(rng=, nb_node=, nb_link=)
+generators = {
+    "static_tree": static_tree,
+    "flat": flat,
+    "clos": clos,
+    "fat_tree": fat_tree,
+    "expander": expander,
+    "opera": opera,
+    "opera_lazy": opera_lazy,
+    "rotor": rotor,
+}
 
 def compute_skewness(slice_to_topo):
     data = {}
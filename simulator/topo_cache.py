@@ -0,0 +1,117 @@
+# On-disk cache of generated topologies and compiled schedules
+#
+# Entries are directories of .npy files named by a content hash: the generator,
+# its parameters and the state of the random generator before generating. They
+# are loaded memory-mapped and read-only, so runs reusing an entry (e.g. the
+# worker processes of a sweep) share one copy in the page cache.
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+import para
+import topo
+from schedule import Schedule
+
+# Bump when the layout of an entry changes
+cache_version = 1
+
+topo_arrays = ("nodes", "edges", "ports", "offsets")
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def get_rng_state(rng) -> dict:
+    return para.generator(rng).bit_generator.state
+
+def set_rng_state(rng, state : dict):
+    para.generator(rng).bit_generator.state = state
+
+def cache_key(*parts) -> str:
+    """Content hash of JSON-serializable parts"""
+    desc = json.dumps([cache_version, *parts], sort_keys=True, default=_jsonable)
+    return hashlib.sha1(desc.encode()).hexdigest()
+
+def save_arrays(path, arrays : dict, meta : dict):
+    """
+    Write an entry atomically: into a temporary directory renamed into place, so
+    that readers never see half an entry. If another process wrote the same entry
+    first, its copy is kept.
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), np.ascontiguousarray(arr))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f, default=_jsonable)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def load_arrays(path, names) -> tuple[dict, dict]:
+    """Memory-mapped arrays and metadata of an entry, None when it is missing"""
+    if not os.path.isdir(path):
+        return None
+    # Plain ndarray views of the memory maps, which numba takes as well
+    arrays = {name: np.asarray(np.load(os.path.join(path, name + ".npy"), mmap_mode="r")) for name in names}
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    return arrays, meta
+
+def cached_topo(cache_dir, topo_func, rng, nb_node, **params) -> topo.SliceTopo:
+    """
+    topo.generate_compact_topo(nb_node, topo_func(rng=rng, nb_node=nb_node, **params)),
+    read from cache_dir when it was generated before from the same rng state.
+    On a hit rng is left in the state generating would leave it in.
+
+    Topologies that are not CompactTopo (e.g. the closed-form topo.opera_lazy) are
+    cheap to generate and are not cached.
+
+    Returns:
+        The topology, with its cache key in cache_key when it is cached
+    """
+    name = f"{topo_func.__module__}.{topo_func.__qualname__}"
+    key = cache_key("topo", name, nb_node, params, get_rng_state(rng))
+    path = os.path.join(cache_dir, key)
+
+    entry = load_arrays(path, topo_arrays)
+    if entry is None:
+        new_topo = topo.generate_compact_topo(nb_node, topo_func(rng=rng, nb_node=nb_node, **params))
+        if not isinstance(new_topo, topo.CompactTopo):
+            return new_topo
+        os.makedirs(cache_dir, exist_ok=True)
+        save_arrays(path, {field: getattr(new_topo, field) for field in topo_arrays},
+                    {"generator": name, "nb_node": nb_node, "params": params, "rng_state": get_rng_state(rng)})
+        entry = load_arrays(path, topo_arrays)
+    arrays, meta = entry
+    set_rng_state(rng, meta["rng_state"])
+
+    cur_topo = topo.CompactTopo(**arrays)
+    cur_topo.cache_key = key
+    return cur_topo
+
+def cached_schedule(cache_dir, cur_topo, failed_node=[], failed_link=[]) -> Schedule:
+    """
+    Schedule(cur_topo, failed_node, failed_link), read from cache_dir when cur_topo
+    comes from cached_topo and was compiled before with the same failures.
+    """
+    key = getattr(cur_topo, "cache_key", None)
+    if key is None:
+        return Schedule(cur_topo, failed_node, failed_link)
+    key = cache_key("schedule", key, np.asarray(failed_node).tolist(), np.asarray(failed_link).tolist())
+    path = os.path.join(cache_dir, key)
+
+    entry = load_arrays(path, Schedule.arrays)
+    if entry is None:
+        schedule = Schedule(cur_topo, failed_node, failed_link)
+        save_arrays(path, {field: getattr(schedule, field) for field in Schedule.arrays}, {"topo": cur_topo.cache_key})
+        entry = load_arrays(path, Schedule.arrays)
+    return Schedule.from_arrays(**entry[0])
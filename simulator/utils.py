@@ -1,7 +1,15 @@
+import hashlib
+import itertools
+import weakref
+from typing import NamedTuple
+
 import networkx as nx
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
 import numpy as np
 
+from stats import ErrorStats
+
 def get_cur_topo(cur_time_ns, slice_duration_ns, topo) -> nx.Graph:
     nb_slice = len(topo.keys())
     cur_slice = (cur_time_ns // slice_duration_ns) % nb_slice
@@ -11,6 +19,267 @@ def get_cur_topo(cur_time_ns, slice_duration_ns, topo) -> nx.Graph:
 def get_neighbors(graph : nx.Graph, node : int) -> list[int]:
     return list(graph.neighbors(node))
 
+_csr_cache = weakref.WeakKeyDictionary()
+
+def get_csr(graph : nx.Graph) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compressed sparse row adjacency of a graph. Cached per graph object,
+    so the graph must not be modified afterwards. A compiled schedule slice
+    already carries its CSR and is returned as is.
+
+    Returns:
+        nodes: node ids in graph.nodes() order, one row per node
+        indptr: neighbors of nodes[i] are indices[indptr[i]:indptr[i+1]]
+        indices: neighbor ids, in graph.neighbors() order
+    """
+    if not isinstance(graph, nx.Graph):
+        return graph.csr
+    csr = _csr_cache.get(graph)
+    if csr is None:
+        adj = graph.adj
+        nodes = np.fromiter(adj, dtype=np.int64, count=len(adj))
+        degrees = np.fromiter((len(adj[node]) for node in adj), dtype=np.int64, count=len(adj))
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+        indices = np.fromiter(itertools.chain.from_iterable(adj[node] for node in adj),
+                              dtype=np.int64, count=indptr[-1])
+        csr = (nodes, indptr, indices)
+        _csr_cache[graph] = csr
+    return csr
+
+def get_graph(topo) -> nx.Graph:
+    """The networkx graph of either a graph or a compiled schedule slice"""
+    if isinstance(topo, nx.Graph):
+        return topo
+    return topo.graph
+
+def csr_from_edges(nodes : np.ndarray, edges : np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    CSR adjacency of a graph given as an edge list, in the order networkx would give:
+    the neighbors of a node are in the order their edge was first added, self loops
+    once. Same as get_csr of a graph built with add_nodes_from(nodes) and add_edge per edge.
+    """
+    row = np.zeros(int(max(nodes.max(initial=-1), edges.max(initial=-1))) + 1, dtype=np.int64)
+    row[nodes] = np.arange(len(nodes))
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    # Both directions of every edge, in edge order
+    src = np.stack([edges[:, 0], edges[:, 1]], axis=1).ravel()
+    dst = np.stack([edges[:, 1], edges[:, 0]], axis=1).ravel()
+    keep = np.ones(len(src), dtype=bool)
+    keep[1::2] = edges[:, 0] != edges[:, 1]
+    src, dst = src[keep], dst[keep]
+    # A repeated edge keeps its first place
+    _, first = np.unique(row[src] * len(row) + dst, return_index=True)
+    first.sort()
+    src, dst = src[first], dst[first]
+
+    order = np.argsort(row[src], kind="stable")
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row[src], minlength=len(nodes)), out=indptr[1:])
+    return np.asarray(nodes, dtype=np.int64), indptr, dst[order]
+
+def csr_edges(csr) -> np.ndarray:
+    """Edges of a CSR adjacency as (node, neighbor) rows, in the order of graph.edges()"""
+    nodes, indptr, indices = csr
+    row = np.zeros(int(max(nodes.max(initial=-1), indices.max(initial=-1))) + 1, dtype=np.int64)
+    row[nodes] = np.arange(len(nodes))
+    src_row = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+    # An edge is listed from the end that comes first
+    first = row[indices] >= src_row
+    return np.stack([nodes[src_row[first]], indices[first]], axis=1)
+
+def csr_copy(csr) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CSR adjacency of graph.copy(), which adds the edges again in graph.edges() order"""
+    return csr_from_edges(csr[0], csr_edges(csr))
+
+def csr_remove_nodes(csr, removed : np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CSR adjacency of the graph with the given nodes removed, like graph.remove_nodes_from()"""
+    nodes, indptr, indices = csr
+    keep_row = ~np.isin(nodes, removed)
+    keep_row_of = np.repeat(keep_row, np.diff(indptr))
+    keep = keep_row_of & ~np.isin(indices, removed)
+    rows = np.repeat(np.arange(len(nodes)), np.diff(indptr))[keep]
+    new_indptr = np.zeros(keep_row.sum() + 1, dtype=indptr.dtype)
+    np.cumsum(np.bincount(rows, minlength=len(nodes))[keep_row], out=new_indptr[1:])
+    return nodes[keep_row], new_indptr, indices[keep]
+
+def csr_remove_edges(csr, edges : np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CSR adjacency of the graph with the given edges removed (missing ones are ignored)"""
+    nodes, indptr, indices = csr
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    nb_id = int(max(nodes.max(initial=-1), edges.max(initial=-1))) + 1
+    # Both directions of every edge, encoded as u * nb_id + v
+    removed = np.concatenate([edges[:, 0] * nb_id + edges[:, 1], edges[:, 1] * nb_id + edges[:, 0]])
+    rows = np.repeat(np.arange(len(nodes)), np.diff(indptr))
+    keep = ~np.isin(nodes[rows] * nb_id + indices, removed)
+    new_indptr = np.zeros(len(indptr), dtype=indptr.dtype)
+    np.cumsum(np.bincount(rows[keep], minlength=len(nodes)), out=new_indptr[1:])
+    return nodes, new_indptr, indices[keep]
+
+def csr_to_graph(csr) -> nx.Graph:
+    """networkx graph with exactly the adjacency of a CSR, neighbor order included"""
+    nodes, indptr, indices = csr
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes.tolist())
+    adj = graph._adj # filled directly, add_edge can not give every neighbor order
+    edge_data = {}
+    for row, node in enumerate(nodes.tolist()):
+        for neighbor in indices[indptr[row]:indptr[row + 1]].tolist():
+            adj[node][neighbor] = edge_data.setdefault((min(node, neighbor), max(node, neighbor)), {})
+    _csr_cache[graph] = csr
+    return graph
+
+def segment_positions(indptr : np.ndarray, rows : np.ndarray) -> np.ndarray:
+    """Positions of the concatenated segments indptr[r]:indptr[r+1] for r in rows"""
+    starts = indptr[rows]
+    degrees = indptr[rows + 1] - starts
+    offsets = np.cumsum(degrees) - degrees
+    return np.repeat(starts - offsets, degrees) + np.arange(degrees.sum())
+
+def segment_sum(values : np.ndarray, indptr : np.ndarray) -> np.ndarray:
+    """
+    Sum of each segment values[..., indptr[i]:indptr[i+1]], added left to right like sum()
+    so that results are bit-identical to the per-node loops. One step per degree.
+    """
+    degrees = np.diff(indptr)
+    total = np.zeros(values.shape[:-1] + (len(degrees),))
+    for k in range(degrees.max(initial=0)):
+        has = degrees > k
+        total[..., has] += values[..., indptr[:-1][has] + k]
+    return total
+
+def bfs_edges(csr, source : int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Level-synchronous BFS giving the edges of nx.bfs_tree(graph, source).edges()
+    in the same order.
+
+    Returns:
+        parents, children: one entry per tree edge
+        depths: depth of each child
+    """
+    nodes, indptr, indices = csr
+    row = np.full(nodes.max(initial=source) + 1, -1)
+    row[nodes] = np.arange(len(nodes))
+    visited = np.zeros(len(row), dtype=bool)
+    visited[source] = True
+    frontier = np.array([source])
+    parents, children, depths = [], [], []
+    depth = 0
+    while len(frontier):
+        depth += 1
+        frontier_rows = row[frontier]
+        positions = segment_positions(indptr, frontier_rows)
+        child = indices[positions]
+        parent = np.repeat(frontier, indptr[frontier_rows + 1] - indptr[frontier_rows])
+        unseen = ~visited[child]
+        child, parent = child[unseen], parent[unseen]
+        # A child discovered by several parents belongs to the first one
+        _, first = np.unique(child, return_index=True)
+        first.sort()
+        child, parent = child[first], parent[first]
+        visited[child] = True
+        parents.append(parent)
+        children.append(child)
+        depths.append(np.full(len(child), depth))
+        frontier = child
+    return np.concatenate(parents), np.concatenate(children), np.concatenate(depths)
+
+def hop_distances(csr, sources : np.ndarray = None) -> np.ndarray:
+    """
+    Hop distances from sources (all nodes by default) to every node, one
+    level-synchronous BFS for all sources at once.
+
+    A sparse frontier is kept as (node, source) pairs and expanded along the CSR, so
+    long paths cost only what they reach. A dense one is bit-packed per node and
+    expanded with bitwise_or.reduceat over all links at once.
+
+    Returns:
+        int16 matrix [source, node id], -1 when not reachable
+    """
+    nodes, indptr, indices = csr
+    if sources is None:
+        sources = nodes
+    sources = np.asarray(sources, dtype=np.int64)
+    nb_src = len(sources)
+    nb_id = int(max(nodes.max(initial=-1), sources.max(initial=-1))) + 1
+    row = np.zeros(nb_id, dtype=np.int64)
+    row[nodes] = np.arange(len(nodes))
+    busy_rows = np.flatnonzero(np.diff(indptr)) # reduceat can not take empty segments
+    mean_degree = len(indices) / max(len(nodes), 1)
+
+    # [node id, source], the frontier is the flat positions node * nb_src + source
+    dist = np.full((nb_id, nb_src), -1, dtype=np.int16)
+    flat_dist = dist.reshape(-1)
+    frontier = sources * nb_src + np.arange(nb_src)
+    flat_dist[frontier] = 0
+    depth = 0
+    while len(frontier) and len(indices):
+        depth += 1
+        if len(frontier) * mean_degree < len(indices) * nb_src / 32:
+            node, src = np.divmod(frontier, nb_src)
+            rows = row[node]
+            neighbors = indices[segment_positions(indptr, rows)]
+            reached = neighbors * nb_src + np.repeat(src, indptr[rows + 1] - indptr[rows])
+            reached = reached[flat_dist[reached] < 0]
+            flat_dist[reached] = depth
+            frontier = np.unique(reached)
+        else:
+            # A node is reached when one of its neighbors is in the frontier
+            bits = np.zeros(nb_id * nb_src, dtype=bool)
+            bits[frontier] = True
+            bits = np.packbits(bits.reshape(nb_id, nb_src), axis=1)
+            reached = np.zeros_like(bits)
+            reached[nodes[busy_rows]] = np.bitwise_or.reduceat(bits[indices], indptr[busy_rows], axis=0)
+            new = np.unpackbits(reached, axis=1, count=nb_src).view(bool) & (dist < 0)
+            dist[new] = depth
+            frontier = np.flatnonzero(new)
+    return np.ascontiguousarray(dist.T)
+
+def all_hop_distances(csr) -> np.ndarray:
+    """Hop distances between all nodes, int16 matrix [node id, node id], -1 when not reachable"""
+    nodes = csr[0]
+    dist = hop_distances(csr)
+    if np.array_equal(nodes, np.arange(len(nodes))):
+        return dist
+    all_dist = np.full((dist.shape[1], dist.shape[1]), -1, dtype=np.int16)
+    all_dist[nodes] = dist
+    return all_dist
+
+_distance_cache = weakref.WeakKeyDictionary()
+
+def get_hop_distances(topo) -> np.ndarray:
+    """
+    All hop distances of a graph or a compiled schedule slice (see all_hop_distances).
+    Computed once per graph or slice, so the graph must not be modified afterwards.
+    """
+    if not isinstance(topo, nx.Graph):
+        return topo.hop_distances()
+    dist = _distance_cache.get(topo)
+    if dist is None:
+        dist = all_hop_distances(get_csr(topo))
+        _distance_cache[topo] = dist
+    return dist
+
+def segment_argmin(values : np.ndarray, indptr : np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Minimum of each non-empty segment values[..., indptr[i]:indptr[i+1]].
+    Ties go to the first position, the same as min() over the segment.
+    Leading axes (e.g. replicas) are reduced independently.
+
+    Returns:
+        rows: ids of the non-empty segments
+        arg: position of the minimum in values, per row
+        minimum: the minimum, per row
+    """
+    degrees = np.diff(indptr)
+    rows = np.flatnonzero(degrees)
+    if len(rows) == 0:
+        return rows, np.zeros(values.shape[:-1] + (0,), dtype=np.int64), values[..., :0]
+    minimum = np.minimum.reduceat(values, indptr[rows], axis=-1)
+    positions = np.arange(values.shape[-1])
+    positions = np.where(values == np.repeat(minimum, degrees[rows], axis=-1), positions, values.shape[-1])
+    return rows, np.minimum.reduceat(positions, indptr[rows], axis=-1), minimum
+
 
 ##### draw
 
@@ -53,36 +322,81 @@ def gen_label(name, value):
         return f"DTP ({value}ns) (on Static)"
         return f"DTP ({value}ns)\n(on Static)"
     print(f"name {name} not found.")
+class CdfStats(NamedTuple):
+    """Tail values and CDF of some data, see cdf_stats"""
+    tails: dict # percent -> tail value
+    x: np.ndarray
+    cdf: np.ndarray
+
+def cdf_stats(data, percents=(99, 99.99, 100), nb_bin=10000) -> CdfStats:
+    """
+    Tail values and CDF of the absolute values of data, for drawing.
+
+    One working copy of the data is made and partitioned once for all percentiles
+    (np.percentile's linear interpolation) and the extremes. The CDF is counted over
+    nb_bin equal bins between them (as np.histogram) chunk by chunk, and only the
+    points where it bends are kept.
+
+    The draw_cdf* functions take the result in place of the data, so data drawn
+    more than once only goes through this once:
+        stats = {label: cdf_stats(data) for label, data in data_dict.items()}
+        draw_cdf(stats, "errors"); draw_cdf_failure(stats, "bounds")
+
+    Args:
+        data: samples of any shape, a stats.ErrorStats, or a CdfStats, returned as is
+        percents: percentiles of the tail values, in [0, 100]
+    Returns:
+        {percent: tail value}, x, cdf
+    """
+    if isinstance(data, CdfStats):
+        return data
+    if isinstance(data, ErrorStats):
+        tails = {percent: float(data.percentile(percent)) for percent in percents}
+        x, cdf = data.cdf()
+    else:
+        values = np.abs(np.ravel(data)).astype(float, copy=False)
+        nb = len(values)
+        pos = np.asarray(percents, dtype=float) / 100 * (nb - 1)
+        low, high = np.floor(pos).astype(np.int64), np.ceil(pos).astype(np.int64)
+        values.partition(np.unique(np.concatenate([low, high, [0, nb - 1]])))
+        tails = {percent: float(values[l] + (values[h] - values[l]) * (p - l))
+                 for percent, p, l, h in zip(percents, pos, low, high)}
+
+        low, high = values[0], values[nb - 1]
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        edges = np.linspace(low, high, nb_bin + 1)
+        width = (high - low) / nb_bin
+        counts = np.zeros(nb_bin, dtype=np.int64)
+        for start in range(0, nb, 1 << 20):
+            bins = ((values[start:start + (1 << 20)] - low) / width).astype(np.int64)
+            counts += np.bincount(np.minimum(bins, nb_bin - 1), minlength=nb_bin)
+        x, cdf = edges[1:], np.cumsum(counts) / nb
+
+    # Drop the inner points of flat runs, the line through the rest is the same
+    keep = np.ones(len(cdf), dtype=bool)
+    keep[1:-1] = (cdf[1:-1] != cdf[:-2]) | (cdf[1:-1] != cdf[2:])
+    return CdfStats(tails, x[keep], cdf[keep])
+
 def draw_cdf(data_dict, name):
     """
     Draw CDF from a dictionary where key is the legend and value is the data.
     All CDF lines are plotted in one matplotlib figure.
     
     Parameters:
-    data_dict (dict): A dictionary where keys are legend labels and values are data arrays
+    data_dict (dict): A dictionary where keys are legend labels and values are data arrays,
+                      stats.ErrorStats or CdfStats (see cdf_stats)
     """
     #plt.figure(figsize=(10, 6))
     
     for label, data in data_dict.items():
         #print(f"{label=}\n{data=}")
-        data = np.array(data).ravel()  # Return a flatten view
-        data = np.abs(data)
-
-        threshold = np.percentile(data, 99)
-        print(f"{label} 99 tail value is {threshold}")
-
-        threshold = np.percentile(data, 99.99)
-        print(f"{label} 99.99 tail value is {threshold}")
-
-        threshold = np.percentile(data, 100)
-        print(f"{label} 100 tail value is {threshold}")
-        data = np.clip(data, 0, threshold)
-
-        cnt, b_cnt = np.histogram(data, bins=10000)
-        pdf = cnt/sum(cnt)
-        cdf = np.cumsum(pdf)
+        # ErrorStats are collected while running, see Simulator(collect_stats=True)
+        tails, x, cdf = cdf_stats(data)
+        for percent, threshold in tails.items():
+            print(f"{label} {percent} tail value is {threshold}")
         
-        plt.plot(b_cnt[1:], cdf,
+        plt.plot(x, cdf,
                  color = color_map[label],
                  linestyle='-',
                  linewidth=5.0,
@@ -128,29 +442,17 @@ def draw_cdf_failure(data_dict, name):
     
     Parameters:
     data_dict (dict): A dictionary where keys are legend labels and values are data arrays
+                      or CdfStats (see cdf_stats)
     """
     #plt.figure(figsize=(10, 6))
     
     for label, data in data_dict.items():
         #print(f"{label=}\n{data=}")
-        data = np.array(data).ravel()  # Return a flatten view
-        data = np.abs(data)
-
-        threshold = np.percentile(data, 99)
-        print(f"{label} 99 tail value is {threshold}")
-
-        threshold = np.percentile(data, 99.99)
-        print(f"{label} 99.99 tail value is {threshold}")
-
-        threshold = np.percentile(data, 100)
-        print(f"{label} 100 tail value is {threshold}")
-        data = np.clip(data, 0, threshold)
-
-        cnt, b_cnt = np.histogram(data, bins=10000)
-        pdf = cnt/sum(cnt)
-        cdf = np.cumsum(pdf)
+        tails, x, cdf = cdf_stats(data)
+        for percent, threshold in tails.items():
+            print(f"{label} {percent} tail value is {threshold}")
         
-        plt.plot(b_cnt[1:], cdf,
+        plt.plot(x, cdf,
                  #color = color_map[label],
                  linestyle='-',
                  linewidth=5.0,
@@ -195,24 +497,18 @@ def draw_cdf_skew(data_dict, name):
     
     Parameters:
     data_dict (dict): A dictionary where keys are legend labels and values are data arrays
+                      or CdfStats (see cdf_stats)
     """
     #plt.figure(figsize=(10, 6))
     color_list = ["red", "blue", "green", "orange", "purple", "brown", "pink", "gray", "olive", "cyan"]
     
     for id, (label, data) in enumerate(data_dict.items()):
         #print(f"{label=}\n{data=}")
-        data = np.array(data).ravel()  # Return a flatten view
-        data = np.abs(data)
-
-        threshold = np.percentile(data, 100)
+        tails, x, cdf = cdf_stats(data, percents=(100,))
+        threshold = tails[100]
         print(f"{label} 100 tail value is {threshold}")
-        data = np.clip(data, 0, threshold)
-
-        cnt, b_cnt = np.histogram(data, bins=10000)
-        pdf = cnt/sum(cnt)
-        cdf = np.cumsum(pdf)
         
-        plt.plot(b_cnt[1:], cdf,
+        plt.plot(x, cdf,
                  color = color_list[id],
                  linestyle='-',
                  linewidth=3.0,
@@ -345,6 +641,69 @@ def draw_tail_trend_failure(data_dict : dict[str, int], x, x_label, y_label, x_t
         name = x_label
     #plt.show()
     plt.savefig(f"failure.pdf")
+# Colormaps of the density plots of scatter_rows, one per series
+density_cmaps = ["Blues", "Oranges", "Greens", "Reds", "Purples", "Greys"]
+
+def _row_chunks(data : np.ndarray, nb_value=1 << 22):
+    """(first row, absolute values of the rows) in chunks of about nb_value values"""
+    nb_row = max(1, nb_value // max(data.shape[1], 1))
+    for start in range(0, len(data), nb_row):
+        yield start, np.abs(data[start:start + nb_row])
+
+def row_top(data : np.ndarray, k) -> np.ndarray:
+    """The k largest absolute values of every row (in no order), all of them in shorter rows"""
+    data = np.asarray(data)
+    k = min(k, data.shape[1])
+    top = np.empty((len(data), k))
+    for start, rows in _row_chunks(data):
+        top[start:start + len(rows)] = np.partition(rows, rows.shape[1] - k, axis=1)[:, rows.shape[1] - k:]
+    return top
+
+def scatter_rows(data : np.ndarray, max_points=1 << 18, nb_bin=(1000, 200), cmap="Blues", **kwargs):
+    """
+    Scatter the absolute values of every row of data at x = row index.
+
+    Up to max_points values are drawn as (rasterized) points. More are drawn as the
+    point density: a 2D histogram of nb_bin (x, y) bins, log colored, counted chunk
+    by chunk of rows without building an x value per point.
+
+    Args:
+        data: (iterations, nodes) array, e.g. Simulator.errors
+        cmap: colormap of the density, and of the points when given c= values.
+            Other points take one color of it (unless given color=), so that series
+            stay apart either way.
+        kwargs: passed on to plt.scatter or plt.pcolormesh
+    """
+    data = np.asarray(data)
+    data = data.reshape(len(data), -1)
+    iters = len(data)
+    if data.size <= max_points:
+        x = np.repeat(np.arange(iters), data.shape[1])
+        if "c" in kwargs:
+            kwargs["cmap"] = cmap
+        elif "color" not in kwargs:
+            kwargs["color"] = plt.get_cmap(cmap)(0.7)
+        return plt.scatter(x, np.abs(data).ravel(), edgecolors='none', rasterized=True, **kwargs)
+
+    low, high = np.inf, -np.inf
+    for _, rows in _row_chunks(data):
+        low, high = min(low, rows.min()), max(high, rows.max())
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    nb_x, nb_y = min(nb_bin[0], iters), nb_bin[1]
+
+    counts = np.zeros(nb_x * nb_y, dtype=np.int64)
+    for start, rows in _row_chunks(data):
+        y_bin = np.minimum(((rows - low) / (high - low) * nb_y).astype(np.int64), nb_y - 1)
+        x_bin = (np.arange(start, start + len(rows)) * nb_x // iters)[:, None]
+        counts += np.bincount((x_bin * nb_y + y_bin).ravel(), minlength=nb_x * nb_y)
+    counts = counts.reshape(nb_x, nb_y).T
+
+    x_edges = np.linspace(0, iters, nb_x + 1) - 0.5
+    y_edges = np.linspace(low, high, nb_y + 1)
+    return plt.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts, 0), norm=LogNorm(),
+                          cmap=cmap, rasterized=True, **kwargs)
+
 def draw_error_scatter(data_dict : dict[str, np.ndarray]):
     """
     Draw scatter figure from a 2D array where x-axis is the first-dimension 
@@ -355,17 +714,11 @@ def draw_error_scatter(data_dict : dict[str, np.ndarray]):
                       and the second dimension represents y-axis values
     """
 
-    for label, data in data_dict.items():
+    for id, (label, data) in enumerate(data_dict.items()):
         #print(f"{label=}\n{data=}")
-        data = np.abs(data)
-
-        iters, nb_nodes = data.shape
-        x = [i for i in range(iters) for _ in range(nb_nodes)]
-        #print(x)
-
-        plt.scatter(x, data.ravel(), label = label, #color=color_map[label],
-                    #alpha=0.5, 
-                    edgecolors='none')
+        scatter_rows(data, label = label, #color=color_map[label],
+                     #alpha=0.5, 
+                     cmap = density_cmaps[id % len(density_cmaps)])
     
 
     font_size = 22
@@ -391,30 +744,15 @@ def draw_error_scatter_topology_change(data_dict : dict[str, np.ndarray]):
                       and the second dimension represents y-axis values
     """
 
-    for label, data in data_dict.items():
+    for id, (label, data) in enumerate(data_dict.items()):
         #print(f"{label=}\n{data=}")
-        data = np.abs(data)
-        #data = np.sort(data)[-30:]
-
-        iters, nb_nodes = data.shape
+        # take the top 10 values of every row
+        top10 = row_top(data, 10)
 
-        x_vals = []
-        y_vals = []
-        
-        for i in range(iters):
-            # take the top 10 values for this row
-            top10 = np.sort(data[i])[-10:]
-            
-            x_vals.extend([i] * len(top10))   # repeat iteration index
-            y_vals.extend(top10)              # corresponding values
-
-        #x = [i for i in range(iters) for _ in range(nb_nodes)]
-        #print(x)
-
-        plt.scatter(x_vals, y_vals, 
-                    #label = label, #color=color_map[label],
-                    #alpha=0.5, 
-                    edgecolors='none')
+        scatter_rows(top10, 
+                     #label = label, #color=color_map[label],
+                     #alpha=0.5, 
+                     cmap = density_cmaps[id % len(density_cmaps)])
     
     plt.axvline(x=100, ymin=0, ymax=1,
                     linestyle="--", 
@@ -451,14 +789,21 @@ def draw_error_scatter_topology_change(data_dict : dict[str, np.ndarray]):
     #plt.show()
 
 def draw_hop_count_cdf(hop_count_dict):
+    """
+    Args:
+        hop_count_dict: name -> syncs by path length, a stats.PathLengthCounter,
+            an array of counts indexed by path length or a dict
+    """
 
     color_list = ["#D55E00","#E69F00","#56B4E9","#009E73","#0072B2","#990000"]
     hop_limit = 5
 
     for id, (name, hop_ctr) in enumerate(hop_count_dict.items()):
-        hop_ctr = {k: v for k, v in hop_ctr.items() if v > 0}
-        hops = np.array(sorted(hop_ctr.keys()))
-        counter = np.array([hop_ctr[k] for k in hops])
+        if isinstance(hop_ctr, dict):
+            hop_ctr = np.bincount(list(hop_ctr.keys()), weights=list(hop_ctr.values())) if hop_ctr else []
+        hop_ctr = np.asarray(getattr(hop_ctr, "counts", hop_ctr))
+        hops = np.flatnonzero(hop_ctr)
+        counter = hop_ctr[hops]
         cumsum = np.cumsum(counter)
         cdf = cumsum / cumsum[-1]
         
@@ -491,14 +836,64 @@ def draw_hop_count_cdf(hop_count_dict):
     plt.savefig("hop_count.pdf")
     #plt.show()
 
+class ConvergenceDetector:
+    """
+    Finds when bounds reach a periodic steady state, in O(N) per step: the bounds of
+    every step, quantized, are hashed together with the position in the schedule, and
+    the state is periodic from the first step that repeats a state seen before (the
+    bound updates only depend on the bounds and the topology).
+
+    Args:
+        resolution: bounds are compared after rounding to multiples of resolution,
+            exactly if None
+    """
+
+    def __init__(self, resolution=None):
+        self.resolution = resolution
+        self.reset()
+
+    def reset(self):
+        """Forget the states seen, e.g. when the topology changes"""
+        self.seen = {} # state hash -> first step
+        self.nb_step = 0
+        self.repeat = None # (first step, the later step with the same state)
+
+    def update(self, bounds : np.ndarray, position=0) -> bool:
+        """
+        Add the state of the next step.
+
+        Args:
+            bounds: bounds after the step
+            position: position of the step in the schedule, e.g. the slice index
+        Returns:
+            Whether a state repeated so far
+        """
+        bounds = np.ascontiguousarray(bounds, dtype=float)
+        if self.resolution is not None:
+            bounds = np.round(bounds / self.resolution).astype(np.int64)
+        key = (position, hashlib.blake2b(bounds.tobytes(), digest_size=16).digest())
+        first = self.seen.setdefault(key, self.nb_step)
+        if first != self.nb_step and self.repeat is None:
+            self.repeat = (first, self.nb_step)
+        self.nb_step += 1
+        return self.repeat is not None
+
+    @property
+    def converged(self) -> bool:
+        return self.repeat is not None
+
+    @property
+    def period(self) -> int:
+        """Steps between two repeated states, None before convergence"""
+        return None if self.repeat is None else self.repeat[1] - self.repeat[0]
+
 def check_converge(bounds):
     print(f"{len(bounds)} iter.")
-    conv_flag = False
+    detector = ConvergenceDetector()
     for id1 in range(len(bounds)):
-        for id2 in range(id1):
-            if (bounds[id1] == bounds[id2]).all():
-                print(f"Iter {id1} same as {id2}")
-                return True
-                conv_flag = True
-    return conv_flag
+        if detector.update(bounds[id1]):
+            id2, id1 = detector.repeat
+            print(f"Iter {id1} same as {id2}")
+            return True
+    return False
 